@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+import io
+import threading
+from dataclasses import dataclass, field
+
+import pygame
+
+
+FONT = 'assets/jetbrainsmononerd.ttf'
+
+
+@dataclass
+class asset_registry:
+    """Asset files are read from disk once per process, fonts are shared per file and size"""
+    data: dict[str, bytes] = field(init=False, default_factory=dict)
+    fonts: dict[tuple[str, int], pygame.font.Font] = field(init=False, default_factory=dict)
+
+    _lock: threading.Lock = field(init=False, default_factory=threading.Lock)
+
+    def read(self, path: str) -> bytes:
+        with self._lock:
+            if path not in self.data:
+                with open(path, 'rb') as f:
+                    self.data[path] = f.read()
+            return self.data[path]
+
+    def font(self, size: int, path: str = FONT) -> pygame.font.Font:
+        key = (path, size)
+        if key not in self.fonts:
+            # the font keeps reading from its file object, so every size gets its own view of the bytes
+            self.fonts[key] = pygame.font.Font(io.BytesIO(self.read(path)), size)
+        return self.fonts[key]
+
+    def preload(self, paths: tuple[str, ...] = (FONT,)) -> threading.Thread:
+        """Reads asset files on a background thread, later reads wait for it instead of opening the file again"""
+        thread = threading.Thread(target=lambda: [self.read(i) for i in paths], name='asset-preload', daemon=True)
+        thread.start()
+        return thread
+
+
+ASSETS = asset_registry()
@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections.abc import Iterable, Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from itertools import islice
+
+from data.codec import LevelFormatError, decode_level, dumps, encode_level, loads
+from data.storage import MAGIC, LevelPack, write_pack
+from solver import Cancelled, Solver
+
+# a level to check: where it came from, its position there and the level dict, pack record or text line
+job = tuple[str, int, object]
+
+VERDICTS = ('unsolvable', 'unique', 'solvable')
+# seconds to search for solutions of a level by default, a few pathological boards would hold up a run for hours
+TIMEOUT = 10.0
+
+
+def read_levels(path: str) -> Iterator[job]:
+    """Levels of a pack or of a text file with one shared level string per line, read as they are needed"""
+    with open(path, 'rb') as f:
+        is_pack = f.read(len(MAGIC)) == MAGIC
+    if is_pack:
+        with LevelPack(path) as pack:
+            for i in range(len(pack)):
+                yield path, i, pack.record(i)
+        return
+    with open(path, encoding='utf-8', errors='replace') as f:
+        for i, line in enumerate(f):
+            if line.strip():
+                yield path, i, line
+
+
+def check_level(source: str, index: int, data: object, solve: bool = True, timeout: float | None = TIMEOUT,
+                keep: bool = False) -> dict:
+    """Decodes and validates one level and searches for up to two solutions, timing both.
+
+    The result is a JSON ready dict, with the level itself under 'level' if `keep` is set and the level is valid."""
+    result = {'source': source, 'index': index}
+    start = time.perf_counter()
+    try:
+        if isinstance(data, bytes):
+            level = decode_level(data)
+        elif isinstance(data, str):
+            level = loads(data)
+        else:
+            level = decode_level(encode_level(data))
+    except LevelFormatError as e:
+        result.update(valid=False, error=str(e), decode_ms=round((time.perf_counter() - start) * 1e3, 3))
+        return result
+    result.update(valid=True, name=level['name'], size=level['size'],
+                  decode_ms=round((time.perf_counter() - start) * 1e3, 3))
+
+    if solve:
+        start = time.perf_counter()
+        stop = None if timeout is None else lambda: time.perf_counter() - start > timeout
+        try:
+            result['verdict'] = VERDICTS[len(Solver(level['size'], level['nodes'], stop).run(2))]
+        except Cancelled:
+            result['verdict'] = 'timeout'
+        result['solve_ms'] = round((time.perf_counter() - start) * 1e3, 3)
+    if keep:
+        result['level'] = level
+    return result
+
+
+def _check_chunk(jobs: list[job], solve: bool, timeout: float | None, keep: bool) -> list[dict]:
+    return [check_level(*i, solve=solve, timeout=timeout, keep=keep) for i in jobs]
+
+
+def check_levels(jobs: Iterable[job], workers: int | None = None, chunk: int = 64, solve: bool = True,
+                 timeout: float | None = TIMEOUT, keep: bool = False, ordered: bool = False) -> Iterator[dict]:
+    """Checks levels on every core and yields the results as their chunks finish, in input order if `ordered` is set.
+
+    Every result keeps the source and index of its level. Only a few chunks per worker are in flight or waiting to
+    be yielded, so memory stays the same however many levels there are."""
+    jobs = iter(jobs)
+    workers = workers or os.cpu_count() or 1
+    running: dict[Future, int] = {}
+    finished: dict[int, list[dict]] = {}
+    submitted = yielded = 0
+    # spawn rather than fork, like the generator pool
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+        while True:
+            while submitted - yielded < 4 * workers and (batch := list(islice(jobs, chunk))):
+                running[executor.submit(_check_chunk, batch, solve, timeout, keep)] = submitted
+                submitted += 1
+            if not running:
+                return
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                finished[running.pop(future)] = future.result()
+            if ordered:
+                while yielded in finished:
+                    yield from finished.pop(yielded)
+                    yielded += 1
+            else:
+                for results in finished.values():
+                    yield from results
+                yielded += len(finished)
+                finished.clear()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Validates, solves, converts and times many levels at once. '
+                                                 'Results are written as JSON lines as they finish, '
+                                                 'in input order with --convert.')
+    parser.add_argument('inputs', nargs='*', help='level packs or text files with one level string per line')
+    parser.add_argument('--builtin', action='store_true', help='check the built in levels too')
+    parser.add_argument('-o', '--output', help='file for the JSON lines, standard output by default')
+    parser.add_argument('-c', '--convert', help='write every valid level to this file, a level pack if it ends in '
+                                                '.pack, one level string per line otherwise')
+    parser.add_argument('--no-solve', action='store_true', help='only check that the levels decode and are valid')
+    parser.add_argument('-t', '--timeout', type=float, default=TIMEOUT,
+                        help=f'seconds to search for solutions of a level, {TIMEOUT:g} by default, 0 for no limit')
+    parser.add_argument('-j', '--jobs', type=int, help='worker processes, one per core by default')
+    parser.add_argument('--chunk', type=int, default=64, help='levels sent to a worker at a time')
+    args = parser.parse_args()
+    if not args.inputs and not args.builtin:
+        parser.error('nothing to check, give some files or --builtin')
+
+    def jobs() -> Iterator[job]:
+        if args.builtin:
+            from data.level import LEVELS
+            for i, level in LEVELS.items():
+                yield '<builtin>', i, level
+        for path in args.inputs:
+            yield from read_levels(path)
+
+    counts = {'levels': 0, 'invalid': 0, **dict.fromkeys(VERDICTS, 0), 'timeout': 0}
+    start = time.perf_counter()
+    out = open(args.output, 'w') if args.output else sys.stdout
+
+    def reported() -> Iterator[dict]:
+        # converted levels keep their input order, so pack indices still match
+        for result in check_levels(jobs(), args.jobs, args.chunk, not args.no_solve, args.timeout or None,
+                                   args.convert is not None, args.convert is not None):
+            level = result.pop('level', None)
+            out.write(json.dumps(result) + '\n')
+            counts['levels'] += 1
+            counts['invalid'] += not result['valid']
+            if 'verdict' in result:
+                counts[result['verdict']] += 1
+            if level is not None:
+                yield level
+
+    try:
+        if args.convert is None:
+            for _ in reported():
+                pass
+        elif args.convert.endswith('.pack'):
+            write_pack(args.convert, reported())
+        else:
+            with open(args.convert, 'w') as f:
+                for level in reported():
+                    f.write(dumps(level) + '\n')
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    elapsed = time.perf_counter() - start
+    print(', '.join(f'{v} {k}' for k, v in counts.items()) + f' in {elapsed:.1f}s '
+          f'({counts["levels"] / max(elapsed, 1e-9):.0f} levels/s)', file=sys.stderr)
+    # timeouts don't fail a run, a level that was never decided isn't known to be broken
+    sys.exit(1 if counts['invalid'] or counts['unsolvable'] else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,241 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import sys
+import timeit
+from typing import Callable
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import pygame
+
+from main import Main
+from camera import DETAIL_BOX
+from core import Core
+from editor import Editor
+from generator import generate_solved
+import raster
+from solver import solve
+from util import clear_color, check_number_connected, check_filled, encode_data, unload_data, FILLED, STRICT
+
+SIZES = (5, 10, 20, 25, 30, 40, 50)
+
+# case name -> function taking the level, its solution and a canvas, returning the callable to time
+CASES: dict[str, Callable[[dict, dict, pygame.Surface], Callable[[], object]]] = {}
+# case name -> biggest board it is timed on, for cases that take too long to repeat on the biggest ones
+MAX_SIZES: dict[str, int] = {}
+
+
+def case(name: str, max_size: int | None = None):
+    def register(f):
+        CASES[name] = f
+        if max_size is not None:
+            MAX_SIZES[name] = max_size
+        return f
+    return register
+
+
+def _core(level: dict, canvas: pygame.Surface) -> Core:
+    core = Core(Main(*canvas.get_size()), canvas)
+    core.run_game_special(level)
+    return core
+
+
+def _solved(level: dict, solution: dict) -> Core:
+    core = _core(level, pygame.Surface((1, 1)))
+    for c, path in solution.items():
+        for x, y in path[1:-1]:
+            core.board.set(core.board.index(x, y), c, FILLED)
+    return core
+
+
+@case('core.create_board')
+def _(level, solution, canvas):
+    core = _core(level, canvas)
+    return core._create_board
+
+
+@case('core.update_board')
+def _(level, solution, canvas):
+    return _core(level, canvas)._update_board
+
+
+@case('editor.update_board')
+def _(level, solution, canvas):
+    editor = Editor(Main(*canvas.get_size()), canvas)
+    editor.board_size = level['size']
+    editor.run()
+    for (x, y), c in level['nodes']:
+        editor.board.set(editor.board.index(x, y), c, FILLED | STRICT)
+    return editor._update_board
+
+
+def _build_layers(level: dict, canvas: pygame.Surface, name: str) -> Callable[[], object]:
+    core = _core(level, canvas)
+    core.main.raster = name
+    # big boards are zoomed in until cells get markers, or both rasters would go through camera.draw_colors
+    while core.camera.box_size < DETAIL_BOX:
+        core.camera.zoom_at(core.camera.view.center, 1)
+    core._update_board()
+
+    def run():
+        core.renderer.layers = None
+        core._update_board()
+    return run
+
+
+@case('core.build_layers')
+def _(level, solution, canvas):
+    return _build_layers(level, canvas, 'cells')
+
+
+if raster.available('numpy'):
+    @case('core.build_layers.numpy')
+    def _(level, solution, canvas):
+        return _build_layers(level, canvas, 'numpy')
+
+
+@case('core.drag')
+def _(level, solution, canvas):
+    core = _core(level, canvas)
+    events = []
+    for path in solution.values():
+        positions = [core.grid.cell_rect(core.board.index(x, y)).center for x, y in path]
+        events.append(pygame.event.Event(pygame.MOUSEBUTTONDOWN, pos=positions[0], button=1))
+        events.extend(pygame.event.Event(pygame.MOUSEMOTION, pos=i, rel=(0, 0), buttons=(1, 0, 0)) for i in positions[1:])
+
+    def run():
+        core.reload_level()
+        for event in events:
+            core.handle_event(event)
+    return run
+
+
+@case('util.clear_color')
+def _(level, solution, canvas):
+    core = _solved(level, solution)
+    c, path = max(solution.items(), key=lambda i: len(i[1]))
+    cells = [core.board.index(x, y) for x, y in path[1:-1]]
+
+    def run():
+        clear_color(core.board, c)
+        for i in cells:
+            core.board.set(i, c, FILLED)
+    return run
+
+
+@case('util.check_number_connected')
+def _(level, solution, canvas):
+    board = _solved(level, solution).board
+    return lambda: check_number_connected(board)
+
+
+@case('connectivity.is_solved')
+def _(level, solution, canvas):
+    core = _core(level, pygame.Surface((1, 1)))
+    for c, path in solution.items():
+        core.pipes.start(core.board.index(*path[0]))
+        for x, y in path[1:]:
+            core.pipes.extend(c, core.board.index(x, y))
+    c, path = max(solution.items(), key=lambda i: len(i[1]))
+    cells = [core.board.index(x, y) for x, y in path]
+
+    def run():
+        # cutting a pipe and drawing it again makes its sets be built again once
+        core.pipes.cut(c, len(cells) // 2)
+        for i in cells[len(cells) // 2:]:
+            core.pipes.extend(c, i)
+        assert core.connectivity.is_solved()
+    return run
+
+
+@case('util.check_filled')
+def _(level, solution, canvas):
+    board = _solved(level, solution).board
+    return lambda: check_filled(board)
+
+
+@case('util.encode_round_trip')
+def _(level, solution, canvas):
+    board = _solved(level, solution).board
+    return lambda: unload_data(encode_data(board, level['name'], level['size']).decode())
+
+
+@case('solver.solve', max_size=30)
+def _(level, solution, canvas):
+    return lambda: solve(level)
+
+
+def measure(f: Callable[[], object], repeat: int = 5) -> dict:
+    """Best and mean time per call in seconds, every run is long enough for timeit.Timer.autorange"""
+    timer = timeit.Timer(f)
+    number, _ = timer.autorange()
+    runs = [i / number for i in timer.repeat(repeat, number)]
+    return {'best': min(runs), 'mean': sum(runs) / len(runs), 'number': number, 'repeat': repeat}
+
+
+def run(sizes: tuple[int, ...], names: list[str], seed: int, repeat: int) -> dict:
+    pygame.init()
+    canvas = pygame.Surface((800, 600))
+    results = {}
+    for size in sizes:
+        level, solution = generate_solved(size, seed)
+        for name in names:
+            if size > MAX_SIZES.get(name, size):
+                continue
+            results[f'{name}/{size}'] = measure(CASES[name](level, solution, canvas), repeat)
+            print(f'{name + "/" + str(size):<36} {results[f"{name}/{size}"]["best"] * 1e6:12.1f} us', file=sys.stderr)
+    return {
+        'meta': {'python': platform.python_version(), 'pygame': pygame.version.ver, 'machine': platform.machine(),
+                 'platform': platform.platform(), 'seed': seed},
+        'results': results,
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list[str]:
+    """Prints the ratio of every result to the baseline, returns the ones slower than `threshold`"""
+    regressions = []
+    for key, value in current['results'].items():
+        if key not in baseline['results']:
+            print(f'{key:<36} {value["best"] * 1e6:12.1f} us          new')
+            continue
+        ratio = value['best'] / baseline['results'][key]['best']
+        flag = ' REGRESSION' if ratio > threshold else ''
+        print(f'{key:<36} {value["best"] * 1e6:12.1f} us  {ratio:7.2f}x{flag}')
+        if flag:
+            regressions.append(key)
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Times board logic, rendering and level codecs.')
+    parser.add_argument('-o', '--output', help='write results to this JSON file')
+    parser.add_argument('-c', '--compare', help='baseline JSON file to compare against')
+    parser.add_argument('-t', '--threshold', type=float, default=1.15,
+                        help='slowdown ratio counted as a regression (default 1.15)')
+    parser.add_argument('-s', '--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('-k', '--cases', nargs='+', default=list(CASES), choices=list(CASES))
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    current = run(tuple(args.sizes), args.cases, args.seed, args.repeat)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(current, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(current, baseline, args.threshold)
+        if regressions:
+            print(f'{len(regressions)} regression(s) over {args.threshold}x', file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
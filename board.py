@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+from array import array
+from functools import lru_cache
+from typing import TYPE_CHECKING, Iterator
+
+from util import tile, color, FILLED, STRICT, CONNECTED
+
+if TYPE_CHECKING:
+    from connectivity import Connectivity
+
+
+@lru_cache(maxsize=None)
+def neighbour_table(size: int) -> tuple[tuple[int, ...], ...]:
+    """Neighbour indices of every cell, in the order of util.NEARBY_TILES"""
+    table = []
+    for i in range(size * size):
+        x, y = i % size, i // size
+        table.append(tuple((y + dy) * size + x + dx for dx, dy in ((0, 1), (0, -1), (1, 0), (-1, 0))
+                           if 0 <= x + dx < size and 0 <= y + dy < size))
+    return tuple(table)
+
+
+class Board:
+    """Square board stored as flat arrays, cell (x, y) lives at index y * size + x.
+
+    Indexing with an (x, y) tuple and iterating over positions still works like the old dict of tiles. All writes go
+    through `set`, which keeps the cells of every color and the filled/connected totals up to date and records the
+    cell in `changed` until whoever draws the board takes it. With a `journal` the first color and flags every cell
+    had since it was last cleared are kept in it, for history.History. A `connectivity` is told about every write."""
+    __slots__ = ('size', 'colors', 'flags', 'neighbours', 'changed', 'by_color', 'filled_count', 'connected_count',
+                 'journal', 'connectivity')
+
+    def __init__(self, size: int):
+        self.size = size
+        self.colors = array('L', [color.gray]) * (size * size)
+        self.flags = bytearray(size * size)
+        self.neighbours = neighbour_table(size)
+        self.changed: set[int] = set()
+        self.by_color: dict[int, set[int]] = {color.gray: set(range(size * size))}
+        self.filled_count = 0
+        self.connected_count = 0
+        self.journal: dict[int, tuple[int, int]] | None = None
+        self.connectivity: Connectivity | None = None
+
+    @classmethod
+    def from_nodes(cls, size: int, nodes: list[tuple[tuple[int, int], int]]) -> Board:
+        return cls.from_cells(size, [y * size + x for (x, y), _ in nodes], [c for _, c in nodes])
+
+    @classmethod
+    def from_cells(cls, size: int, cells: list[int], colors: list[int]) -> Board:
+        """Board with a filled strict endpoint of colors[k] at every cells[k], the cells must all differ.
+
+        Writes the arrays and totals in bulk instead of going through `set`, there's no journal or connectivity yet."""
+        board = cls(size)
+        gray = board.by_color[color.gray]
+        gray.difference_update(cells)
+        if not gray:
+            del board.by_color[color.gray]
+        by_color = board.by_color
+        for i, c in zip(cells, colors):
+            board.colors[i] = c
+            board.flags[i] = FILLED | STRICT
+            if c in by_color:
+                by_color[c].add(i)
+            else:
+                by_color[c] = {i}
+        board.filled_count = len(cells)
+        board.changed.update(cells)
+        return board
+
+    def index(self, x: int, y: int) -> int:
+        return y * self.size + x
+
+    def position(self, i: int) -> tuple[int, int]:
+        return i % self.size, i // self.size
+
+    def tile(self, i: int) -> tile:
+        return tile(self, i)
+
+    def __len__(self) -> int:
+        return len(self.flags)
+
+    def __iter__(self) -> Iterator[tuple[int, int]]:
+        size = self.size
+        return ((i % size, i // size) for i in range(len(self.flags)))
+
+    def __contains__(self, key: tuple[int, int]) -> bool:
+        x, y = key
+        return 0 <= x < self.size and 0 <= y < self.size
+
+    def __getitem__(self, key: tuple[int, int]) -> tile:
+        if key not in self:
+            raise KeyError(key)
+        return tile(self, self.index(*key))
+
+    def set(self, i: int, c: int, flags: int) -> None:
+        old_c, old_flags = self.colors[i], self.flags[i]
+        if old_c == c and old_flags == flags:
+            return
+        if self.journal is not None and i not in self.journal:
+            self.journal[i] = (old_c, old_flags)
+
+        if old_c != c:
+            cells = self.by_color[old_c]
+            cells.discard(i)
+            if not cells:
+                del self.by_color[old_c]
+            self.by_color.setdefault(c, set()).add(i)
+            self.colors[i] = c
+        if (old_flags ^ flags) & FILLED:
+            self.filled_count += 1 if flags & FILLED else -1
+        if (old_flags ^ flags) & CONNECTED:
+            self.connected_count += 1 if flags & CONNECTED else -1
+        self.flags[i] = flags
+        self.changed.add(i)
+        if self.connectivity is not None:
+            self.connectivity.update(i, old_c, old_flags, c, flags)
+
+    def take_changes(self) -> set[int]:
+        changed = self.changed
+        self.changed = set()
+        return changed
+
+    def is_filled(self) -> bool:
+        return self.filled_count == len(self.flags)
+
+    def count_connected(self) -> int:
+        return self.connected_count
+
+    def count_color(self, c: int) -> int:
+        return len(self.by_color.get(c, ()))
+
+    def find_color(self, c: int) -> list[int]:
+        return sorted(self.by_color.get(c, ()))
+
+    def clear_color(self, c: int) -> None:
+        """Removes the pipe of a color, its strict endpoints stay and are marked as not connected"""
+        for i in self.find_color(c):
+            if self.flags[i] & STRICT:
+                self.set(i, c, self.flags[i] & ~CONNECTED)
+                continue
+            self.set(i, color.gray, self.flags[i] & ~FILLED)
+
+    def nodes(self) -> list[tuple[tuple[int, int], int]]:
+        return [(self.position(i), self.colors[i]) for i, f in enumerate(self.flags)
+                if f & STRICT and f & FILLED]
@@ -0,0 +1,167 @@
+from __future__ import annotations
+
+from array import array
+from dataclasses import dataclass, field
+
+import pygame
+
+from util import grid
+
+MAX_BOX = 120
+ZOOM_STEP = 1.25
+# below this many pixels per cell boards are drawn as a scaled up picture of their colors
+DETAIL_BOX = 8
+
+
+def board_view(x_size: int, y_size: int) -> pygame.Rect:
+    """Square part of the window the board is drawn in, 350 pixels in an 800 by 600 window"""
+    side = max(50, min(350 * max(1, x_size // 800), x_size - 20, y_size - 150))
+    rect = pygame.Rect(0, 0, side, side)
+    rect.center = x_size // 2, y_size // 2 + 15
+    return rect
+
+
+def draw_colors(canvas: pygame.Surface, colors: array, layout: grid) -> pygame.Rect:
+    """Draws every visible cell as a plain square of its color in one scaled blit, returns the drawn area"""
+    size = layout.size
+    picture = pygame.Surface((size, size), 0, 32, (0xff0000, 0x00ff00, 0x0000ff, 0))
+    data = array('I', colors).tobytes()
+    if picture.get_pitch() == size * 4:
+        picture.get_buffer().write(data)
+    else:
+        for y in range(size):
+            picture.get_buffer().write(data[y * size * 4:(y + 1) * size * 4], y * picture.get_pitch())
+    columns, rows = layout.visible_range()
+    if not columns or not rows:
+        return pygame.Rect(layout.x, layout.y, 0, 0)
+    part = picture.subsurface((columns.start, rows.start, len(columns), len(rows)))
+    part = pygame.transform.scale(part, (len(columns) * layout.box_size, len(rows) * layout.box_size))
+    rect = canvas.blit(part, (layout.x + columns.start * layout.box_size, layout.y + rows.start * layout.box_size))
+    return rect
+
+
+@dataclass
+class Camera:
+    """Zoom and pan of a board inside of the `view` rectangle of the window.
+
+    At the lowest zoom the whole board fits the view, like the fixed layout used to. `x` and `y` are the board pixel
+    shown at the top left of the view, they are negative while the board is smaller than the view so it stays centered.
+    The wheel zooms at the pointer, dragging with the middle or right button or with ctrl held pans and +, - and 0
+    zoom in, out and back to the whole board."""
+    size: int
+    view: pygame.Rect = field(default_factory=lambda: pygame.Rect(0, 0, 0, 0))
+
+    box_size: int = field(init=False, default=0)
+    x: int = field(init=False, default=0)
+    y: int = field(init=False, default=0)
+    fitted: bool = field(init=False, default=True)
+    moved: bool = field(init=False, default=False)
+    pointer: tuple[int, int] | None = field(init=False, default=None)
+    dragging: bool = field(init=False, default=False)
+
+    @property
+    def fit_size(self) -> int:
+        return max(1, min(self.view.w, self.view.h) // self.size)
+
+    @property
+    def max_size(self) -> int:
+        return max(self.fit_size, MAX_BOX)
+
+    @property
+    def grid(self) -> grid:
+        return grid(self.view.x - self.x, self.view.y - self.y, self.box_size, self.size, self.view)
+
+    def set_view(self, view: pygame.Rect) -> None:
+        if view == self.view and self.box_size:
+            return
+        self.view = view
+        if self.fitted or self.box_size < self.fit_size:
+            self.fit()
+        else:
+            self._clamp()
+            self.moved = True
+
+    def fit(self) -> None:
+        self.box_size = self.fit_size
+        self.fitted = True
+        self._clamp()
+        self.moved = True
+
+    def _clamp(self) -> None:
+        board = self.size * self.box_size
+        if board <= self.view.w:
+            self.x = -((self.view.w - board) // 2)
+        else:
+            self.x = max(0, min(self.x, board - self.view.w))
+        if board <= self.view.h:
+            self.y = -((self.view.h - board) // 2)
+        else:
+            self.y = max(0, min(self.y, board - self.view.h))
+
+    def zoom_at(self, pos: tuple[int, int], steps: float) -> None:
+        """Zooms by ZOOM_STEP per step, keeping the point of the board under `pos` where it is"""
+        box = round(self.box_size * ZOOM_STEP ** steps)
+        if box == self.box_size:
+            box += 1 if steps > 0 else -1
+        box = max(self.fit_size, min(box, self.max_size))
+        if box == self.box_size:
+            return
+        px, py = pos[0] - self.view.x, pos[1] - self.view.y
+        self.x = round((px + self.x) * box / self.box_size - px)
+        self.y = round((py + self.y) * box / self.box_size - py)
+        self.box_size = box
+        self.fitted = box == self.fit_size
+        self._clamp()
+        self.moved = True
+
+    def pan(self, dx: int, dy: int) -> None:
+        previous = self.x, self.y
+        self.x += dx
+        self.y += dy
+        self._clamp()
+        if (self.x, self.y) != previous:
+            self.moved = True
+
+    def take_moved(self) -> bool:
+        moved = self.moved
+        self.moved = False
+        return moved
+
+    def handle_event(self, event: pygame.event.Event) -> bool:
+        """Zooms and pans, returns True if the event was used up by the camera"""
+        if event.type == pygame.MOUSEMOTION:
+            self.pointer = event.pos
+            if self.dragging:
+                self.pan(-event.rel[0], -event.rel[1])
+                return True
+
+        if event.type == pygame.MOUSEWHEEL:
+            pos = self.pointer if self.pointer is not None and self.view.collidepoint(self.pointer) else self.view.center
+            self.zoom_at(pos, event.y)
+            return True
+
+        if event.type in (pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP) and event.button in (4, 5):
+            # the old style wheel buttons come along with every MOUSEWHEEL
+            return True
+
+        if event.type == pygame.MOUSEBUTTONDOWN and self.view.collidepoint(event.pos) and (
+                event.button in (2, 3) or event.button == 1 and pygame.key.get_mods() & pygame.KMOD_CTRL):
+            self.pointer = event.pos
+            self.dragging = True
+            return True
+
+        if event.type == pygame.MOUSEBUTTONUP and self.dragging:
+            self.dragging = False
+            return True
+
+        if event.type == pygame.KEYDOWN:
+            if event.key in (pygame.K_EQUALS, pygame.K_PLUS, pygame.K_KP_PLUS):
+                self.zoom_at(self.view.center, 1)
+                return True
+            if event.key in (pygame.K_MINUS, pygame.K_KP_MINUS):
+                self.zoom_at(self.view.center, -1)
+                return True
+            if event.key in (pygame.K_0, pygame.K_KP0):
+                self.fit()
+                return True
+        return False
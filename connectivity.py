@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+from board import Board
+from pipes import linked
+from util import color, STRICT, LINK
+
+
+class Connectivity:
+    """Which endpoint pairs are joined by an unbroken pipe, kept up to date by Board.set.
+
+    Every pipe cell is in a union-find set with the cell its LINK flags point back to, so a pipe that reaches its
+    other endpoint puts both endpoints in the same set. Painting a cell is one union. Union-find can't split sets, so
+    when a cell is taken off a pipe its color is only marked and the sets of that color are built again from its cells
+    the next time it is asked about, which costs the length of the pipe rather than the size of the board."""
+
+    def __init__(self, board: Board):
+        self.board = board
+        self.parent = list(range(len(board)))
+        self.endpoints: dict[int, list[int]] = {}
+        for i, f in enumerate(board.flags):
+            if f & STRICT and board.colors[i] != color.gray:
+                self.endpoints.setdefault(board.colors[i], []).append(i)
+        self.joined: set[int] = set()
+        # colors whose sets have to be built again before they can be trusted
+        self.dirty: set[int] = set(self.endpoints)
+        board.connectivity = self
+
+    def _find(self, i: int) -> int:
+        parent = self.parent
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def _check(self, c: int) -> None:
+        ends = self.endpoints.get(c)
+        if ends and len(ends) > 1 and len({self._find(i) for i in ends}) == 1:
+            self.joined.add(c)
+        else:
+            self.joined.discard(c)
+
+    def _rebuild(self) -> None:
+        board = self.board
+        parent = self.parent
+        size = board.size
+        for c in self.dirty:
+            cells = board.by_color.get(c, ())
+            for i in cells:
+                parent[i] = i
+            for i in cells:
+                if board.flags[i] & LINK:
+                    j = linked(i, board.flags[i], size)
+                    if board.colors[j] == c:
+                        parent[self._find(i)] = self._find(j)
+            self._check(c)
+        self.dirty.clear()
+
+    def update(self, i: int, old_c: int, old_flags: int, c: int, flags: int) -> None:
+        """Called by Board.set after a cell changed"""
+        if old_c != color.gray and (old_c != c or old_flags & LINK and old_flags & LINK != flags & LINK):
+            self.dirty.add(old_c)
+        if c == color.gray or c in self.dirty or not flags & LINK or old_c == c and old_flags & LINK == flags & LINK:
+            return
+        j = linked(i, flags, self.board.size)
+        if self.board.colors[j] != c:
+            # written before the cell it follows, like cells put back by an undo in whatever order
+            self.dirty.add(c)
+            return
+        if old_c != c:
+            self.parent[i] = i
+        self.parent[self._find(i)] = self._find(j)
+        if c in self.endpoints:
+            self._check(c)
+
+    def is_joined(self, c: int) -> bool:
+        """Whether both endpoints of a color are joined by its pipe"""
+        if self.dirty:
+            self._rebuild()
+        return c in self.joined
+
+    def count(self) -> int:
+        """Number of colors whose endpoints are joined"""
+        if self.dirty:
+            self._rebuild()
+        return len(self.joined)
+
+    def is_solved(self) -> bool:
+        """Every pair joined and no empty cell left"""
+        return self.count() == len(self.endpoints) and self.board.is_filled()
@@ -6,8 +6,17 @@ from typing import TYPE_CHECKING
 import pygame
 from pygame import draw
 
-from data.level import LEVELS
-from util import tile, clear_canvas, draw_centered_text, clear_color, get_nearby, check_filled, color, encode_data
+from assets import ASSETS
+from board import Board
+from camera import Camera, DETAIL_BOX, board_view
+from connectivity import Connectivity
+from data.storage import LevelPack
+from history import History
+from layers import BoardLayers, BoardRenderer, opaque
+from pipes import Pipes
+from profiler import profiled
+import raster
+from util import color, grid, STRICT, CONNECTED, FILLED
 
 if TYPE_CHECKING:
     from main import Main
@@ -18,19 +27,31 @@ class Core:
     main: Main
     canvas: pygame.Surface
 
-    board: dict[tuple[int, int], tile] = field(init=False, default_factory=dict)
+    board: Board = field(init=False, default=None)
+    grid: grid = field(init=False, default=None)
+    camera: Camera = field(init=False, default=None)
+    history: History = field(init=False, default=None)
+    pipes: Pipes = field(init=False, default=None)
+    connectivity: Connectivity = field(init=False, default=None)
+    renderer: BoardRenderer = field(init=False, default=None)
     loaded: bool = field(init=False, default=False)
 
     level: int = field(init=False, default=0)
     level_name: str = field(init=False)
     level_size: int = field(init=False)
     level_nodes: list[tuple[tuple[int, int], int]] = field(init=False)
-    selected: tile = field(init=False, default=None)
-    connected: int = field(init=False, default=0)
+    selected: int | None = field(init=False, default=None)
+    # color of the pipe being drawn from the selected cell
+    drawing: int | None = field(init=False, default=None)
+    # cell the pointer was last seen in while drawing a pipe
+    drag_cell: int | None = field(init=False, default=None)
     required: int = field(init=False)
+    moves: int = field(init=False, default=0)
+    last_moved: int | None = field(init=False, default=None)
 
-    time_start: int = field(init=False)
-    time_end: int = field(init=False)
+    # seconds on the clock of Main.now
+    time_start: float = field(init=False)
+    time_end: float = field(init=False)
 
     font_24: pygame.font.Font = field(init=False)
     font_30: pygame.font.Font = field(init=False)
@@ -38,62 +59,105 @@ class Core:
     font_60: pygame.font.Font = field(init=False)
 
     def __post_init__(self):
-        self.font_24 = pygame.font.Font('assets/jetbrainsmononerd.ttf', 24)
-        self.font_30 = pygame.font.Font('assets/jetbrainsmononerd.ttf', 30)
-        self.font_42 = pygame.font.Font('assets/jetbrainsmononerd.ttf', 42)
-        self.font_60 = pygame.font.Font('assets/jetbrainsmononerd.ttf', 60)
+        self.font_24 = ASSETS.font(24)
+        self.font_30 = ASSETS.font(30)
+        self.font_42 = ASSETS.font(42)
+        self.font_60 = ASSETS.font(60)
+
+    def _draw_cell(self, layers: BoardLayers, i: int, local: grid) -> None:
+        """Draws a cell on the layers, endpoints go on the static layer under the pipes"""
+        visible = local.visible_rect(i)
+        board = self.board
+        if local.box_size < DETAIL_BOX:
+            # too small for markers, every color is kept on the pipe layer
+            layers.pipes.fill(opaque(board.colors[i]), visible)
+            return
+        flags = board.flags[i]
+        if flags & STRICT:
+            layers.static.fill(board.colors[i], visible)
+        if i == self.selected:
+            layers.overlay.fill(opaque(color.gray), visible)
+            draw.rect(layers.overlay, opaque(board.colors[i]), local.cell_rect(i), False, 25)
+        elif flags & FILLED and not flags & STRICT:
+            layers.pipes.fill(opaque(board.colors[i]), visible)
+
+    @staticmethod
+    def _draw_arrays(layers: BoardLayers, local: grid, colors, flags) -> None:
+        strict = flags & STRICT != 0
+        raster.draw_cells(layers.static, colors, strict, local)
+        raster.draw_cells(layers.pipes, colors, (flags & FILLED != 0) & ~strict, local)
+
+    @staticmethod
+    def _marker(flags: int) -> str:
+        return '\u2713' if flags & CONNECTED else 'X'
+
+    def _layout(self) -> None:
+        self.camera.set_view(board_view(self.main.x_size, self.main.y_size))
+        self.grid = self.camera.grid
+
+    @profiled('Core._update_board')
+    def _update_board(self) -> None:
+        self._layout()
+        self.renderer.draw(self.canvas, self.main.raster)
 
     @property
-    def factor(self) -> int:
-        return self.main.x_size // 800
-
-    def _update_board(self) -> None:
-        box_size = 350 * self.factor // self.level_size
-        x_start = self.main.x_center - (self.level_size * box_size) // 2
-        y_start = self.main.y_center - (self.level_size * box_size) // 2 + 15
-
-        draw.rect(self.canvas, 0xffffff, pygame.Rect(x_start - 5, y_start - 5, self.level_size * box_size + 10,
-                                                     self.level_size * box_size + 10), 5)
-
-        for i in self.board:
-            self.board[i].hit_box = draw.rect(self.canvas, self.board[i].color,
-                                              pygame.Rect(x_start + box_size * i[0], y_start + box_size * i[1], box_size, box_size), False, 25 if self.board[i] == self.selected else 0)
-            if self.board[i].strict:
-                draw_centered_text(self.canvas,
-                                   self.font_30.render('\u2713' if self.board[i].connected else 'X', True, 0x000000),
-                                   x_start + box_size // 2 + box_size * i[0], y_start + box_size // 2 + box_size * i[1])
-
-    def _create_board(self) -> None:
-        if self.level_nodes:
-            for i in self.level_nodes:
-                self.board[i[0]] = tile(*i[0], color=i[1])
-        for i in range(self.level_size):
-            for j in range(self.level_size):
-                if (i, j) in self.board:
-                    continue
-                self.board[(i, j)] = tile(i, j, filled=False, strict=False)
-        self._update_board()
+    def connected(self) -> int:
+        return self.connectivity.count() if self.connectivity is not None else 0
+
+    def _won(self) -> bool:
+        if not self.connectivity.is_solved():
+            return False
+        self.time_end = self.main.now()
+        return True
+
+    def _select(self, i: int | None) -> None:
+        for j in (self.selected, i):
+            if j is not None:
+                self.board.changed.add(j)
+        self.selected = i
+        self.drawing = self.board.colors[i] if i is not None else None
+        self.drag_cell = i
+
+    def _create_board(self, board: Board | None = None) -> None:
+        self.board = board if board is not None else Board.from_nodes(self.level_size, self.level_nodes or [])
+        self.history = History(self.board)
+        self.pipes = Pipes(self.board)
+        self.connectivity = Connectivity(self.board)
+        if self.camera is None or self.camera.size != self.level_size:
+            self.camera = Camera(self.level_size)
+        self.renderer = BoardRenderer(self.board, self.camera, self._draw_cell, self._draw_arrays, self._marker,
+                                      lambda: () if self.selected is None else (self.selected,))
+        self._layout()
 
     def _clear_board(self):
-        self.board = {}
+        self.board = None
         self.selected = None
-        self.connected = 0
+        self.moves = 0
+        self.last_moved = None
 
     def run_game(self, level: int) -> None:
         self._clear_board()
 
+        levels = self.main.levels
+        if isinstance(levels, LevelPack):
+            # decoded straight into the board, the nodes are only read back for reloading and the score key
+            self.level_name, board = levels.board(level)
+            self.level_size = board.size
+            self.level_nodes = board.nodes()
+        else:
+            data = levels[level]
+            self.level_name = data['name']
+            self.level_size = data['size']
+            self.level_nodes = data['nodes']
+            board = None
         self.level = level
-        self.level_name = LEVELS[level]['name']
-        self.level_size = LEVELS[level]['size']
-        self.level_nodes = LEVELS[level]['nodes']
-        self.required = len(LEVELS[level]['nodes']) // 2
-        self.time_start = self.main.number_tick
+        self.required = len(self.level_nodes) // 2
+        self.time_start = self.main.now()
 
-        self._create_board()
-        clear_canvas(self.canvas)
-        self._update_board()
+        self._create_board(board)
 
-    def run_game_special(self, data: dict) -> None:
+    def run_game_special(self, data: dict, board: Board | None = None) -> None:
+        """Plays a level that isn't in main.levels, `board` is used as it is if it was already built from `data`"""
         self._clear_board()
 
         self.level = -1
@@ -101,60 +165,80 @@ class Core:
         self.level_size = data['size']
         self.level_nodes = data['nodes']
         self.required = len(data['nodes']) // 2
-        self.time_start = self.main.number_tick
+        self.time_start = self.main.now()
         self.loaded = True
 
-        self._create_board()
-        clear_canvas(self.canvas)
-        self._update_board()
+        self._create_board(board)
 
     def reload_level(self):
         self._clear_board()
-        self.time_start = self.main.number_tick
+        self.time_start = self.main.now()
         self._create_board()
-        clear_canvas(self.canvas)
-        self._update_board()
 
     def draw(self):
         self._update_board()
-        
+
+    def draw_changes(self) -> list[pygame.Rect]:
+        """Redraws only the cells changed since the last draw, returns the updated areas"""
+        return self.renderer.draw_changes(self.canvas, self.main.raster)
+
+    @profiled('Core.handle_event')
     def handle_event(self, event: pygame.event) -> bool:
         """Handle events for the game, returns True if the game is over"""
+        if event.type == pygame.VIDEORESIZE:
+            self._layout()
+        if self.camera.handle_event(event):
+            self.grid = self.camera.grid
+            return False
+        if self.history.handle_event(event):
+            self._select(None)
+            applied = self.history.applied
+            self.pipes.rebuild([c for c, _ in applied.values()] + [self.board.colors[i] for i in applied])
+            # redoing the last move of a level finishes it like making it did
+            return self._won()
+        if event.type == pygame.MOUSEBUTTONUP:
+            # everything from pressing the button to letting go is one move
+            self.history.commit()
+
         if event.type == pygame.MOUSEBUTTONDOWN:
-            mouse_pos = pygame.mouse.get_pos()
-
-            for i, j in self.board:
-                t1 = self.board[(i, j)]
-                if t1.hit_box.collidepoint(mouse_pos) and t1.strict and t1.color != color.gray:
-                    if t1 == self.selected or t1.connected:
-                        clear_color(self.board, t1.color)
-                        self.selected = None
-                        continue
-                    self.selected = self.board[(i, j)]
-
-        if self.selected and event.type == pygame.MOUSEMOTION:
-            mouse_pos = pygame.mouse.get_pos()
-            select_color = self.selected.color
-            for i, j in self.board:
-                t1 = self.board[(i, j)]
-                if t1.hit_box.collidepoint(mouse_pos):
-                    is_color_nearby = any([b.color == select_color for b in get_nearby(self.board, i, j) if (
-                            b.strict and b == self.selected) or not b.strict])  ## check if the color is nearby and able to connect
-                    if t1.strict and is_color_nearby and t1 != self.selected and t1.color == select_color:
-                        self.selected.connected = True
-                        self.selected = None
-                        self.connected += 1
-                        t1.connected = True
-                        if self.connected == self.required and check_filled(self.board):
-                            self.time_end = self.main.number_tick
-                            return True
-                        continue
-                    if t1.strict:
-                        continue
-                    if is_color_nearby:
-                        if t1.filled and t1.color != select_color:
-                            clear_color(self.board, t1.color)
-                        t1.color = select_color
-                        t1.filled = True
+            board = self.board
+            i = self.grid.cell_at(event.pos)
+
+            if i is not None and board.flags[i] & STRICT and board.colors[i] != color.gray:
+                if i == self.selected or board.flags[i] & CONNECTED:
+                    self.pipes.clear(board.colors[i])
+                    self._select(None)
+                else:
+                    self.pipes.start(i)
+                    self._select(i)
+            elif i is not None and self.pipes.color_at(i) is not None:
+                # carrying on from a cell of a pipe cuts off what comes after it
+                self.pipes.grab(i)
+                self._select(i)
+            # like flow, carrying on with the pipe moved last doesn't count as another move
+            if self.drawing is not None and self.drawing != self.last_moved:
+                self.moves += 1
+                self.last_moved = self.drawing
+
+        if self.selected is not None and event.type == pygame.MOUSEMOTION:
+            for pos in getattr(event, 'path', [event.pos]):
+                i = self.grid.cell_at(pos)
+                if i is None and self.drag_cell is not None:
+                    # a flick off the board still reaches its edge
+                    i = self.grid.nearest_cell(pos)
+                cells = [] if i is None or i == self.drag_cell else (
+                    [i] if self.drag_cell is None else self.grid.line(self.drag_cell, i))
+                self.drag_cell = self.grid.cell_at(pos)
+                for j in cells:
+                    if self._extend(j):
+                        return True
+                    if self.selected is None:
+                        return False
         return False
-                        
+
+    def _extend(self, i: int) -> bool:
+        """Drags the head of the selected pipe into a cell, returns True if that finished the level"""
+        if not self.pipes.extend(self.drawing, i):
+            return False
+        self._select(None)
+        return self._won()
@@ -0,0 +1,240 @@
+from __future__ import annotations
+
+import ast
+import base64
+import binascii
+import zlib
+from collections import Counter
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from board import Board
+
+# binary level layout, every number is an unsigned LEB128 varint:
+#   magic 'OP', version byte, flags byte, then the body (zlib compressed if FLAG_ZLIB is set)
+#   body: size, name length, utf-8 name, palette length, palette colors,
+#         node count, then per node the cell index delta (nodes sorted by y * size + x) and its palette index
+MAGIC = b'OP'
+VERSION = 1
+FLAG_ZLIB = 1
+
+MAX_SIZE = 1024
+MAX_NAME = 1024
+COMPRESS_OVER = 96
+
+
+class LevelFormatError(ValueError):
+    """Raised for any level data that can't be decoded or doesn't describe a valid level"""
+
+
+def _write_varint(out: bytearray, value: int) -> None:
+    while value > 0x7f:
+        out.append(value & 0x7f | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data: bytes, pos: int) -> tuple[int, int]:
+    value = 0
+    shift = 0
+    while True:
+        if pos >= len(data):
+            raise LevelFormatError('level data ends in the middle of a number')
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+        if shift > 35:
+            raise LevelFormatError('number in level data is too long')
+
+
+def _check(name: str, size: int, cells: list[int], colors: list[int]) -> None:
+    if not 1 <= size <= MAX_SIZE:
+        raise LevelFormatError(f'invalid board size {size}')
+    if len(name.encode('utf-8')) > MAX_NAME:
+        raise LevelFormatError('level name is too long')
+    if len(set(cells)) != len(cells):
+        raise LevelFormatError('two nodes share a cell')
+    if cells and (min(cells) < 0 or max(cells) >= size * size):
+        raise LevelFormatError('node outside of the board')
+    if colors and (min(colors) < 0 or max(colors) > 0xffffffff):
+        raise LevelFormatError(f'invalid color {next(c for c in colors if not 0 <= c <= 0xffffffff)}')
+    for c, count in Counter(colors).items():
+        if count != 2:
+            raise LevelFormatError(f'color {c:#08x} has {count} endpoints instead of 2')
+
+
+def encode_level(level: dict, compress: bool | None = None) -> bytes:
+    """Encodes a level dict into the binary format, `compress` None only compresses when it makes the data smaller.
+
+    Raises LevelFormatError if the dict isn't a valid level, whatever is missing or of the wrong type."""
+    try:
+        size = level['size']
+        name = str(level.get('name', ''))
+        nodes = sorted((y * size + x, c) for (x, y), c in level['nodes'])
+    except (AttributeError, KeyError, TypeError, ValueError) as e:
+        raise LevelFormatError(f'malformed level: {e!r}') from None
+    if not isinstance(size, int) or any(not isinstance(v, int) for node in nodes for v in node):
+        raise LevelFormatError('board size, node positions and colors must be integers')
+    _check(name, size, [i for i, _ in nodes], [c for _, c in nodes])
+
+    palette: dict[int, int] = {}
+    for _, c in nodes:
+        palette.setdefault(c, len(palette))
+
+    body = bytearray()
+    _write_varint(body, size)
+    encoded_name = name.encode('utf-8')
+    _write_varint(body, len(encoded_name))
+    body += encoded_name
+    _write_varint(body, len(palette))
+    for c in palette:
+        _write_varint(body, c)
+    _write_varint(body, len(nodes))
+    previous = 0
+    for i, c in nodes:
+        _write_varint(body, i - previous)
+        _write_varint(body, palette[c])
+        previous = i
+
+    flags = 0
+    if compress or compress is None and len(body) > COMPRESS_OVER:
+        packed = zlib.compress(bytes(body), 9)
+        if compress or len(packed) < len(body):
+            body = packed
+            flags |= FLAG_ZLIB
+    return MAGIC + bytes((VERSION, flags)) + bytes(body)
+
+
+def _decode(data: bytes) -> tuple[str, int, list[int], list[int]]:
+    """Returns the name, size, cell indices and colors of the nodes"""
+    if len(data) < 4 or data[:2] != MAGIC:
+        raise LevelFormatError('not a level')
+    if data[2] != VERSION:
+        raise LevelFormatError(f'unsupported level version {data[2]}')
+    flags = data[3]
+    if flags & ~FLAG_ZLIB:
+        raise LevelFormatError(f'unknown level flags {flags:#x}')
+    body = data[4:]
+    if flags & FLAG_ZLIB:
+        try:
+            body = zlib.decompress(body)
+        except zlib.error as e:
+            raise LevelFormatError(f'corrupt compressed level data: {e}') from None
+
+    size, pos = _read_varint(body, 0)
+    length, pos = _read_varint(body, pos)
+    if length > MAX_NAME or pos + length > len(body):
+        raise LevelFormatError('invalid level name')
+    try:
+        name = body[pos:pos + length].decode('utf-8')
+    except UnicodeDecodeError:
+        raise LevelFormatError('level name is not valid utf-8') from None
+    pos += length
+
+    count, pos = _read_varint(body, pos)
+    if count > len(body):
+        raise LevelFormatError('invalid palette')
+    palette = []
+    for _ in range(count):
+        c, pos = _read_varint(body, pos)
+        palette.append(c)
+
+    count, pos = _read_varint(body, pos)
+    if count > len(body):
+        raise LevelFormatError('invalid node count')
+    cells = []
+    colors = []
+    cell = 0
+    end = len(body)
+    for _ in range(count):
+        # nearly every delta and palette index fits in one byte, only longer numbers go through _read_varint
+        if pos < end and body[pos] < 0x80:
+            delta = body[pos]
+            pos += 1
+        else:
+            delta, pos = _read_varint(body, pos)
+        if pos < end and body[pos] < 0x80:
+            index = body[pos]
+            pos += 1
+        else:
+            index, pos = _read_varint(body, pos)
+        if index >= len(palette):
+            raise LevelFormatError('node color outside of the palette')
+        cell += delta
+        cells.append(cell)
+        colors.append(palette[index])
+    if pos != len(body):
+        raise LevelFormatError('trailing data after level')
+
+    _check(name, size, cells, colors)
+    return name, size, cells, colors
+
+
+def decode_level(data: bytes) -> dict:
+    name, size, cells, colors = _decode(data)
+    return {'name': name, 'size': size, 'nodes': [((i % size, i // size), c) for i, c in zip(cells, colors)]}
+
+
+def decode_board(data: bytes) -> tuple[str, Board]:
+    """Decodes straight into the arrays of a Board, without building the node list of a level dict"""
+    from board import Board
+
+    name, size, cells, colors = _decode(data)
+    return name, Board.from_cells(size, cells, colors)
+
+
+def to_text(data: bytes) -> str:
+    """URL safe base64 without padding, for sharing through the clipboard"""
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def from_text(text: str | bytes) -> bytes:
+    if isinstance(text, bytes):
+        text = text.decode('ascii', 'replace')
+    text = ''.join(text.split())
+    try:
+        return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+    except (binascii.Error, ValueError):
+        raise LevelFormatError('level text is not base64') from None
+
+
+def dumps(level: dict, compress: bool | None = None) -> str:
+    return to_text(encode_level(level, compress))
+
+
+def loads(text: str | bytes) -> dict:
+    """Decodes shared level text, also accepts the old base64(str(dict)) strings"""
+    data = from_text(text)
+    if data[:2] == MAGIC:
+        return decode_level(data)
+    return _load_legacy(data)
+
+
+def loads_board(text: str | bytes) -> tuple[str, Board]:
+    """Like loads, but decodes straight into a Board"""
+    data = from_text(text)
+    if data[:2] == MAGIC:
+        return decode_board(data)
+    from board import Board
+
+    level = _load_legacy(data)
+    return level['name'], Board.from_nodes(level['size'], level['nodes'])
+
+
+def _load_legacy(data: bytes) -> dict:
+    try:
+        level = ast.literal_eval(data.decode('utf-8'))
+        name, size = level['name'], level['size']
+        nodes = [((x, y), c) for (x, y), c in level['nodes']]
+    except (UnicodeDecodeError, SyntaxError, ValueError, TypeError, KeyError, MemoryError, RecursionError):
+        raise LevelFormatError('not a level') from None
+    if not isinstance(name, str) or not isinstance(size, int) or \
+            not all(isinstance(i, int) for (x, y), c in nodes for i in (x, y, c)):
+        raise LevelFormatError('not a level')
+    if any(not 0 <= x < size or not 0 <= y < size for (x, y), _ in nodes):
+        raise LevelFormatError('node outside of the board')
+    _check(name, size, [y * size + x for (x, y), _ in nodes], [c for _, c in nodes])
+    return {'name': name, 'size': size, 'nodes': nodes}
@@ -0,0 +1,208 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+from dataclasses import dataclass, asdict
+
+from data.codec import encode_level
+
+LOG = 'scores.log'
+INDEX = 'best.json'
+# queued to have the thread load the best times
+LOAD = 'load'
+
+
+def level_key(level: dict) -> str:
+    """Hash of the size and nodes of a level, the same puzzle gets the same key whatever it is called"""
+    data = encode_level({'size': level['size'], 'nodes': level['nodes']}, compress=False)
+    return hashlib.sha1(data).hexdigest()[:16]
+
+
+def default_directory() -> str:
+    return os.environ.get('OPENPIPES_HOME') or os.path.join(os.path.expanduser('~'), '.openpipes')
+
+
+@dataclass
+class score:
+    level: str
+    seconds: float
+    moves: int
+    timestamp: float
+    name: str = ''
+
+    def beats(self, other: score | None) -> bool:
+        return other is None or (self.seconds, self.moves) < (other.seconds, other.moves)
+
+
+class ScoreStore:
+    """Completed levels, appended as JSON lines to scores.log by a background thread.
+
+    `add` only queues the record, the thread writes whatever is queued and fsyncs at most every `interval` seconds and
+    when the store is flushed or closed. The best score of every level is kept in best.json together with the length
+    of the log it covers, so loading the best times only reads the log written after the last compaction. Loading
+    happens on the thread too, `best` doesn't wait for it and has nothing until `load` was called and finished."""
+
+    def __init__(self, directory: str | None = None, interval: float = 2.0):
+        self.directory = directory or default_directory()
+        self.interval = interval
+        os.makedirs(self.directory, exist_ok=True)
+        self.log_path = os.path.join(self.directory, LOG)
+        self.index_path = os.path.join(self.directory, INDEX)
+
+        self._lock = threading.Lock()
+        self._best: dict[str, score] | None = None
+        self._session: list[score] = []
+        # set once the best times are loaded, until the picker took the news
+        self._fresh = False
+        self._queue: queue.Queue = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='scores', daemon=True)
+        self._thread.start()
+
+    def add(self, record: score) -> None:
+        """Queues a completed level, never waits for the disk"""
+        if self._closed:
+            raise ValueError('score store is closed')
+        with self._lock:
+            self._session.append(record)
+            if self._best is not None and record.beats(self._best.get(record.level)):
+                self._best[record.level] = record
+        self._queue.put(record)
+
+    def load(self) -> None:
+        """Starts loading the best times on the thread, does nothing if they are loaded already"""
+        if self._best is None and not self._closed:
+            self._queue.put(LOAD)
+
+    def take_loaded(self) -> bool:
+        """True once after the best times finished loading"""
+        with self._lock:
+            fresh, self._fresh = self._fresh, False
+            return fresh
+
+    def flush(self) -> None:
+        """Blocks until everything added so far is written and fsynced"""
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait()
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+
+    def __enter__(self) -> ScoreStore:
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    def _run(self) -> None:
+        with open(self.log_path, 'ab') as f:
+            if f.tell():
+                # a crash can leave half a line behind, keep the next record off it
+                with open(self.log_path, 'rb') as log:
+                    log.seek(-1, os.SEEK_END)
+                    if log.read(1) != b'\n':
+                        f.write(b'\n')
+            dirty = False
+            synced = time.monotonic()
+            while True:
+                timeout = max(0.0, self.interval - (time.monotonic() - synced)) if dirty else None
+                try:
+                    batch = [self._queue.get(timeout=timeout)]
+                except queue.Empty:
+                    batch = []
+                while True:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+
+                records = [i for i in batch if isinstance(i, score)]
+                if records:
+                    f.write(b''.join(json.dumps(asdict(i)).encode() + b'\n' for i in records))
+                    dirty = True
+                waiting = [i for i in batch if isinstance(i, threading.Event)]
+                stop = None in batch
+                if LOAD in batch:
+                    self._loaded()
+                if dirty and (waiting or stop or time.monotonic() - synced >= self.interval):
+                    f.flush()
+                    os.fsync(f.fileno())
+                    dirty = False
+                    synced = time.monotonic()
+                for i in waiting:
+                    i.set()
+                if stop:
+                    f.flush()
+                    self._compact(f.tell())
+                    return
+
+    def _compact(self, offset: int) -> None:
+        """Writes best.json with everything up to `offset` in the log, loading the best times first if needed"""
+        best = self._loaded()
+        with self._lock:
+            data = {'offset': offset, 'best': {k: asdict(v) for k, v in best.items()}}
+        temporary = self.index_path + '.tmp'
+        with open(temporary, 'w') as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.index_path)
+
+    def _load(self) -> dict[str, score]:
+        best: dict[str, score] = {}
+        offset = 0
+        try:
+            with open(self.index_path) as f:
+                data = json.load(f)
+            offset = data['offset']
+            best = {k: score(**v) for k, v in data['best'].items()}
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+        try:
+            with open(self.log_path, 'rb') as f:
+                if offset > os.fstat(f.fileno()).st_size:
+                    # the log was replaced since the index was written
+                    offset, best = 0, {}
+                f.seek(offset)
+                for line in f:
+                    try:
+                        record = score(**json.loads(line))
+                    except (ValueError, TypeError):
+                        continue
+                    if record.beats(best.get(record.level)):
+                        best[record.level] = record
+        except OSError:
+            pass
+        return best
+
+    def _loaded(self) -> dict[str, score]:
+        if self._best is not None:
+            return self._best
+        # read outside of the lock so `add` and `best` on the main thread never wait for the disk
+        best = self._load()
+        with self._lock:
+            # records of this session may still be queued, they are added again in case they are not on disk yet
+            for record in self._session:
+                if record.beats(best.get(record.level)):
+                    best[record.level] = record
+            self._best = best
+            self._fresh = True
+            return best
+
+    def best(self, level: str) -> score | None:
+        """Best score of a level, None if there is none or the best times are not loaded yet"""
+        best = self._best
+        return best.get(level) if best is not None else None
+
+    def bests(self) -> dict[str, score]:
+        return dict(self._loaded())
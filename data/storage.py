@@ -1,2 +1,203 @@
-import pathlib as pl
+from __future__ import annotations
 
+import argparse
+import mmap
+import os
+import struct
+from array import array
+from bisect import bisect_right
+from collections.abc import Iterable, Iterator, Mapping
+from typing import TYPE_CHECKING
+
+from data.codec import LevelFormatError, decode_board, decode_level, encode_level
+
+if TYPE_CHECKING:
+    from board import Board
+
+# pack layout:
+#   header: magic 'OPPK', version, 3 padding bytes
+#   data: every level as a data.codec record, one after another
+#   index: one INDEX entry per level, (record offset, record length, board size, reserved)
+#   footer: offset of the index, number of levels, magic 'OPIX'
+# new levels are written after the old footer, followed by the whole index and a new footer, the old index and
+# footer are left behind as unused bytes until the pack is written again with write_pack
+MAGIC = b'OPPK'
+FOOTER_MAGIC = b'OPIX'
+VERSION = 1
+HEADER = struct.Struct('<4sB3x')
+INDEX = struct.Struct('<QIHH')
+FOOTER = struct.Struct('<QI4s')
+
+
+class LevelPack(Mapping):
+    """Read only view of a level pack file, behaves like the LEVELS dict with ids 0 to len - 1.
+
+    The file is memory mapped, opening it only reads the footer and a level is only decoded when it is looked up.
+    A file that isn't a pack raises LevelFormatError, so does looking up a damaged record."""
+
+    def __init__(self, path: str | os.PathLike):
+        self.path = os.fspath(path)
+        with open(self.path, 'rb') as f:
+            try:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # mmap refuses empty files
+                raise LevelFormatError('file is too small to be a level pack') from None
+        self._sizes: dict[int, array] | None = None
+        try:
+            if len(self._map) < HEADER.size + FOOTER.size:
+                raise LevelFormatError('file is too small to be a level pack')
+            magic, version = HEADER.unpack_from(self._map)
+            if magic != MAGIC:
+                raise LevelFormatError('not a level pack')
+            if version != VERSION:
+                raise LevelFormatError(f'unsupported level pack version {version}')
+            self._index_offset, self._count, magic = FOOTER.unpack_from(self._map, len(self._map) - FOOTER.size)
+            if magic != FOOTER_MAGIC or self._index_offset + self._count * INDEX.size != len(self._map) - FOOTER.size:
+                raise LevelFormatError('level pack index is damaged')
+        except LevelFormatError:
+            self._map.close()
+            raise
+
+    def close(self) -> None:
+        self._map.close()
+
+    def __enter__(self) -> LevelPack:
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(range(self._count))
+
+    def __contains__(self, level: object) -> bool:
+        return isinstance(level, int) and 0 <= level < self._count
+
+    def _entry(self, level: int) -> tuple[int, int, int, int]:
+        return INDEX.unpack_from(self._map, self._index_offset + level * INDEX.size)
+
+    def record(self, level: int) -> bytes:
+        """The encoded level, see data.codec"""
+        if level not in self:
+            raise KeyError(level)
+        offset, length, _, _ = self._entry(level)
+        return self._map[offset:offset + length]
+
+    def __getitem__(self, level: int) -> dict:
+        return decode_level(self.record(level))
+
+    def board(self, level: int) -> tuple[str, Board]:
+        """Name of a level and a new Board holding its nodes, decoded without going through the level dict"""
+        return decode_board(self.record(level))
+
+    def size_of(self, level: int) -> int:
+        """Board size of a level, read from the index without decoding the level"""
+        if level not in self:
+            raise KeyError(level)
+        return self._entry(level)[2]
+
+    def _by_size(self) -> dict[int, array]:
+        if self._sizes is None:
+            self._sizes = {}
+            index = memoryview(self._map)[self._index_offset:self._index_offset + self._count * INDEX.size]
+            for level, (_, _, size, _) in enumerate(INDEX.iter_unpack(index)):
+                self._sizes.setdefault(size, array('L')).append(level)
+            index.release()
+        return self._sizes
+
+    def sizes(self) -> list[int]:
+        return sorted(self._by_size())
+
+    def of_size(self, size: int) -> list[int]:
+        """Ids of every level with the given board size, in order"""
+        return list(self._by_size().get(size, ()))
+
+    def next(self, level: int, size: int | None = None) -> int | None:
+        """The level after `level`, optionally the next one with a board of `size`"""
+        if size is None:
+            return level + 1 if level + 1 in self else None
+        levels = self._by_size().get(size, ())
+        i = bisect_right(levels, level)
+        return levels[i] if i < len(levels) else None
+
+
+def _write_levels(f, levels: Iterable[dict], index: bytearray) -> int:
+    count = 0
+    for level in levels:
+        record = encode_level(level)
+        index += INDEX.pack(f.tell(), len(record), level['size'], 0)
+        f.write(record)
+        count += 1
+    return count
+
+
+def write_pack(path: str | os.PathLike, levels: Iterable[dict]) -> int:
+    """Writes a new pack, returns the number of levels in it"""
+    index = bytearray()
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION))
+        count = _write_levels(f, levels, index)
+        index_offset = f.tell()
+        f.write(index)
+        f.write(FOOTER.pack(index_offset, count, FOOTER_MAGIC))
+    return count
+
+
+def append_pack(path: str | os.PathLike, levels: Iterable[dict]) -> range:
+    """Adds levels to the end of a pack, creating it if needed, returns the ids they were given"""
+    if not os.path.exists(path):
+        return range(write_pack(path, levels))
+    # every level is encoded before the file is touched, so one that isn't valid leaves the pack as it was
+    records = [(encode_level(level), level['size']) for level in levels]
+    with LevelPack(path) as pack:
+        start = len(pack)
+        index = bytearray(pack._map[pack._index_offset:pack._index_offset + start * INDEX.size])
+        end = len(pack._map)
+    with open(path, 'r+b') as f:
+        f.seek(end)
+        try:
+            for record, size in records:
+                index += INDEX.pack(f.tell(), len(record), size, 0)
+                f.write(record)
+            index_offset = f.tell()
+            f.write(index)
+            # the footer goes last, until it is written the old one is still the end of the file
+            f.write(FOOTER.pack(index_offset, start + len(records), FOOTER_MAGIC))
+        except BaseException:
+            f.truncate(end)
+            raise
+    return range(start, start + len(records))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Builds level packs.')
+    parser.add_argument('pack')
+    parser.add_argument('--builtin', action='store_true', help='add the built in levels')
+    parser.add_argument('-n', '--generate', type=int, default=0, help='add this many generated levels')
+    parser.add_argument('-s', '--sizes', type=int, nargs='+', default=[5, 6, 7, 8, 9])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-a', '--append', action='store_true', help='add to the pack instead of replacing it')
+    args = parser.parse_args()
+
+    def levels() -> Iterator[dict]:
+        if args.builtin:
+            from data.level import LEVELS
+            yield from LEVELS.values()
+        if args.generate:
+            from generator import generate
+            for i in range(args.generate):
+                yield generate(args.sizes[i % len(args.sizes)], args.seed + i)
+
+    if args.append:
+        ids = append_pack(args.pack, levels())
+    else:
+        ids = range(write_pack(args.pack, levels()))
+    print(f'{args.pack}: added {len(ids)} levels')
+
+
+if __name__ == '__main__':
+    main()
@@ -10,18 +10,37 @@ from pygame import draw
 if TYPE_CHECKING:
     from main import Main
 
-from util import tile, draw_centered_text, clear_canvas, color, find_color
+from assets import ASSETS
+from board import Board
+from camera import Camera, DETAIL_BOX, board_view
+from history import History
+from layers import BoardLayers, BoardRenderer, opaque
+from profiler import profiled
+import raster
+from util import draw_centered_text, render_text, clear_canvas, color, grid, FILLED, STRICT
+from validator import Validator, verdict
+
+SIZES = (5, 6, 7, 8, 9, 15, 25, 50, 100, 200)
 
 
 @dataclass
 class Editor:
     main: Main
     canvas: pygame.Surface
-
-    board: dict[tuple[int, int], tile] = field(init=False, default_factory=dict)
+    validator: Validator | None = None
+
+    board: Board = field(init=False, default=None)
+    grid: grid = field(init=False, default=None)
+    camera: Camera = field(init=False, default=None)
+    history: History = field(init=False, default=None)
+    renderer: BoardRenderer = field(init=False, default=None)
+    buttons: tuple[tuple, list[tuple[pygame.Surface, tuple[int, int]]]] = field(init=False, default=None)
     board_size: int = field(init=False, default=5)
     board_name: str = field(init=False, default='Untitled Board')
     name_box_selected: bool = field(init=False, default=False)
+    blink: bool = field(init=False, default=False)
+    invalid_data: bool = field(init=False, default=False)
+    verdict: verdict | None = field(init=False, default=None)
 
     color_buttons: dict[int, pygame.rect] = field(init=False, default_factory=dict)
     size_buttons: dict[int, pygame.rect] = field(init=False, default_factory=dict)
@@ -34,10 +53,10 @@ class Editor:
     font_60: pygame.font.Font = field(init=False)
 
     def __post_init__(self):
-        self.font_24 = pygame.font.Font('assets/jetbrainsmononerd.ttf', 24)
-        self.font_30 = pygame.font.Font('assets/jetbrainsmononerd.ttf', 30)
-        self.font_42 = pygame.font.Font('assets/jetbrainsmononerd.ttf', 42)
-        self.font_60 = pygame.font.Font('assets/jetbrainsmononerd.ttf', 60)
+        self.font_24 = ASSETS.font(24)
+        self.font_30 = ASSETS.font(30)
+        self.font_42 = ASSETS.font(42)
+        self.font_60 = ASSETS.font(60)
 
     @property
     def factor(self) -> int:
@@ -47,62 +66,116 @@ class Editor:
     def textbox_rect(self) -> pygame.Rect:
         return pygame.Rect(self.main.x_center - 210 * self.factor, 55, 2 * 210 * self.factor, 2 * 25)
 
+    def _draw_cell(self, layers: BoardLayers, i: int, local: grid) -> None:
+        layers.pipes.fill(opaque(self.board.colors[i]), local.visible_rect(i))
+        if local.box_size >= DETAIL_BOX:
+            draw.rect(layers.overlay, opaque(0xffffff), local.cell_rect(i), True)
+
+    @staticmethod
+    def _draw_arrays(layers: BoardLayers, local: grid, colors, flags) -> None:
+        raster.draw_cells(layers.pipes, colors, None, local)
+        raster.draw_outlines(layers.overlay, 0xffffff, local)
+
+    def _draw_board(self) -> None:
+        self.camera.set_view(board_view(self.main.x_size, self.main.y_size))
+        self.grid = self.camera.grid
+        self.renderer.draw(self.canvas, self.main.raster)
+
+    def _render_buttons(self) -> list[tuple[pygame.Surface, tuple[int, int]]]:
+        names = [i for i in dir(color) if not i.startswith('__')]
+        colors = pygame.Surface((50, 60 * len(names) - 10))
+        clear_canvas(colors)
+        x = self.main.x_size - 110
+        for i, j in enumerate(names):
+            selected = self.selected_color == getattr(color, j)
+            rect = draw.rect(colors, getattr(color, j), pygame.Rect(0, 60 * i, 50, 50), width=5 if selected else 0)
+            self.color_buttons[getattr(color, j)] = rect.move(x, 5)
+            if getattr(color, j) == color.gray:
+                draw_centered_text(colors, render_text(self.font_24, '\uf12d', 0xffffffff), 25, 60 * i + 25)
+
+        # board size selector, the large sizes get a second column
+        sizes = pygame.Surface((105, 250))
+        clear_canvas(sizes)
+        for i, j in enumerate(SIZES):
+            x, y = 55 * (i // 5), 50 * (i % 5)
+            rect = draw.rect(sizes, color.blue, pygame.Rect(x, y, 50, 50), self.board_size == j)
+            self.size_buttons[j] = rect.move(60, 100)
+            draw_centered_text(sizes, render_text(self.font_24, str(j), 0xffffff), x + 25, y + 25)
+        return [(colors, (self.main.x_size - 110, 5)), (sizes, (60, 100))]
+
+    def _draw_buttons(self) -> None:
+        """Draws the color and size selectors, which are only rendered again once they look different"""
+        key = (self.selected_color, self.board_size, self.main.x_size)
+        if self.buttons is None or self.buttons[0] != key:
+            self.buttons = (key, self._render_buttons())
+        for surface, pos in self.buttons[1]:
+            self.canvas.blit(surface, pos)
+
+    @profiled('Editor._update_board')
     def _update_board(self) -> None:
-        box_size = 350 * self.factor // self.board_size
-        x_start = self.main.x_center - (self.board_size * box_size) // 2
-        y_start = self.main.y_center - (self.board_size * box_size) // 2 + 15
-
-        draw.rect(self.canvas, 0xffffff, pygame.Rect(x_start - 5, y_start - 5, self.board_size * box_size + 10,
-                                                     self.board_size * box_size + 10), 5)
+        self._draw_board()
 
         # level name text box
-        text = self.board_name[-28 * self.factor:]
         draw.rect(self.canvas, 0xffffff, self.textbox_rect, 3)
-        self.canvas.blit(self.font_24.render(text + '_' if time.time() % 1 > 0.5 and self.name_box_selected else text, True, 0xffffffff),
-                         (self.main.x_center - 210 * self.factor + 10, 65))
-
-        # draws color selector
-        for i, j in enumerate([i for i in dir(color) if not i.startswith('__')]):
-            selected = self.selected_color == getattr(color, j)
-            self.color_buttons[getattr(color, j)] = draw.rect(self.canvas, getattr(color, j),
-                                                              pygame.Rect(self.main.x_size - 110, 5 + 60 * i, 50, 50), width=5 if selected else 0)
-            if getattr(color, j) == color.gray:
-                draw_centered_text(self.canvas, self.font_24.render('\uf12d', True, 0xffffffff), self.main.x_size - 85, 5 + 60 * i + 25)
-
-        # draws board size selector
-        for i, j in enumerate(range(5, 10)):
-            self.size_buttons[j] = draw.rect(self.canvas, color.blue, pygame.Rect(60, 100 + 50 * i, 50, 50), self.board_size == j)
-            draw_centered_text(self.canvas, self.font_24.render(str(j), True, 0xffffff), 85, 100 + 50 * i + 25)
+        self._draw_name()
 
-        # draws board
-        for i in self.board:
-            self.board[i].hit_box = draw.rect(self.canvas, self.board[i].color,
-                                              pygame.Rect(x_start + box_size * i[0], y_start + box_size * i[1], box_size, box_size), False)
-            draw.rect(self.canvas, 0xffffff, pygame.Rect(x_start + box_size * i[0], y_start + box_size * i[1], box_size, box_size), True)
+        self._draw_buttons()
 
-            if self.board[i].strict:
-                draw_centered_text(self.canvas, self.font_30.render('X', True, 0x000000),
-                                   x_start + box_size // 2 + box_size * i[0], y_start + box_size // 2 + box_size * i[1])
+    def _draw_name(self) -> None:
+        text = self.board_name[-28 * self.factor:]
+        self.blink = time.time() % 1 > 0.5 and self.name_box_selected
+        self.canvas.blit(render_text(self.font_24, text + '_' if self.blink else text, 0xffffffff),
+                         (self.main.x_center - 210 * self.factor + 10, 65))
 
     def _clear_board(self) -> None:
-        self.board = dict()
+        self.board = None
 
     def _generate_board(self) -> None:
-        self.board = {(x, y): tile(x, y, strict=False, filled=False) for x in range(self.board_size) for y in
-                      range(self.board_size)}
+        self.board = Board(self.board_size)
+        self.history = History(self.board)
+        self.camera = Camera(self.board_size)
+        self.renderer = BoardRenderer(self.board, self.camera, self._draw_cell, self._draw_arrays, lambda flags: 'X')
+
+    def _validate(self) -> None:
+        if self.validator is not None:
+            self.verdict = self.validator.submit(self.board_size, self.board.nodes())
+
+    def update(self) -> None:
+        """Picks up the verdict on the board once the validator has one"""
+        if self.validator is not None:
+            self.verdict = self.validator.poll() or self.verdict
 
     def run(self):
         self._clear_board()
         self._generate_board()
+        self._validate()
         clear_canvas(self.canvas)
         self._update_board()
 
     def draw(self):
         self._update_board()
 
+    def draw_changes(self) -> list[pygame.Rect]:
+        """Redraws the cells that changed or the whole board after the camera moved, returns the updated areas"""
+        return self.renderer.draw_changes(self.canvas, self.main.raster)
+
+    def draw_cursor(self) -> list[pygame.Rect]:
+        """Redraws the name box when the cursor blinks, returns the updated areas"""
+        if self.blink == (time.time() % 1 > 0.5 and self.name_box_selected):
+            return []
+        clear_canvas(self.canvas, self.textbox_rect.inflate(-6, -6))
+        self._draw_name()
+        return [self.textbox_rect]
+
+    @profiled('Editor.handle_event')
     def handle_event(self, event: pygame.event.Event):
+        # while typing the name, + - and 0 go into the name instead of zooming
+        if not (event.type == pygame.KEYDOWN and self.name_box_selected) and self.camera.handle_event(event):
+            self.grid = self.camera.grid
+            return
+
         if event.type == pygame.MOUSEBUTTONDOWN:
-            mouse_pos = pygame.mouse.get_pos()
+            mouse_pos = event.pos
 
             if self.textbox_rect.collidepoint(mouse_pos):
                 self.name_box_selected = True
@@ -118,14 +191,16 @@ class Editor:
                     self.board_size = i
                     self.run()
 
-            for i in self.board:
-                if self.board[i].hit_box.collidepoint(mouse_pos) and len(find_color(self.board, self.selected_color)) != 2:
-                    self.board[i].color = self.selected_color
-                    self.board[i].filled = True
-                    self.board[i].strict = self.selected_color != color.gray
+            i = self.grid.cell_at(mouse_pos)
+            if i is not None and self.board.count_color(self.selected_color) != 2:
+                self.board.set(i, self.selected_color, FILLED | STRICT if self.selected_color != color.gray else FILLED)
+                if self.history.commit():
+                    self._validate()
 
         if event.type == pygame.KEYDOWN:
             if not self.name_box_selected:
+                if self.history.handle_event(event):
+                    self._validate()
                 return
 
             if event.key == pygame.K_BACKSPACE:
@@ -1,22 +1,30 @@
 from __future__ import annotations
 
-import binascii
 import enum
 import random
+import time
 from typing import TYPE_CHECKING
 
 import pygame.mouse
 from pygame import draw
 
 from loader import Loader
+from picker import Picker
 
 if TYPE_CHECKING:
+    from board import Board
     from main import Main
 
+from assets import ASSETS
 from core import Core
 from editor import Editor
+from generator import GeneratorPool
+from profiler import profiled
+from thumbnails import ThumbnailCache
+from validator import Validator, verdict
 from util import *
-from data.level import LEVELS
+from data.codec import LevelFormatError
+from data.scores import level_key, score
 
 TITLE_W = 270
 TITLE_H = 35
@@ -30,6 +38,7 @@ class mode(enum.Enum):
     WIN = 2
     EDITOR = 3
     LOAD = 4
+    PICKER = 5
 
 
 @dataclass
@@ -40,8 +49,16 @@ class Game:
     core: Core = field(init=False, default=None)
     editor: Editor = field(init=False, default=None)
     loader: Loader = field(init=False, default=None)
+    picker: Picker = field(init=False, default=None)
+    generator: GeneratorPool = field(init=False)
+    validator: Validator = field(init=False, default_factory=Validator)
+    thumbnails: ThumbnailCache = field(init=False)
 
     mode: mode = field(init=False, default=mode.MENU)
+    redraw: bool = field(init=False, default=True)
+    # a level of main.levels that failed to decode, reported until the screen changes
+    invalid_level: int | None = field(init=False, default=None)
+    labels: dict[str, tuple[str, pygame.Rect]] = field(init=False, default_factory=dict)
 
     font_24: pygame.font.Font = field(init=False)
     font_30: pygame.font.Font = field(init=False)
@@ -49,14 +66,20 @@ class Game:
     font_60: pygame.font.Font = field(init=False)
 
     def __post_init__(self):
-        self.font_24 = pygame.font.Font('assets/jetbrainsmononerd.ttf', 24)
-        self.font_30 = pygame.font.Font('assets/jetbrainsmononerd.ttf', 30)
-        self.font_42 = pygame.font.Font('assets/jetbrainsmononerd.ttf', 42)
-        self.font_60 = pygame.font.Font('assets/jetbrainsmononerd.ttf', 60)
+        self.font_24 = ASSETS.font(24)
+        self.font_30 = ASSETS.font(30)
+        self.font_42 = ASSETS.font(42)
+        self.font_60 = ASSETS.font(60)
+        self.generator = GeneratorPool()
+        self.thumbnails = ThumbnailCache(self.main.levels)
 
     @property
     def start_rect(self) -> pygame.Rect:
-        return pygame.Rect(self.main.x_center - TITLE_W, 250 - TITLE_H, 2 * TITLE_W, 2 * TITLE_H)
+        return pygame.Rect(self.main.x_center - TITLE_W, 250 - TITLE_H, TITLE_W - 5, 2 * TITLE_H)
+
+    @property
+    def picker_rect(self) -> pygame.Rect:
+        return pygame.Rect(self.main.x_center + 5, 250 - TITLE_H, TITLE_W - 5, 2 * TITLE_H)
 
     @property
     def level_editor(self) -> pygame.Rect:
@@ -83,60 +106,71 @@ class Game:
     def main_menu(self) -> None:
         self.mode = mode.MENU
         clear_canvas(self.canvas)
-        draw_centered_text(self.canvas, self.font_60.render('OpenPipe', True, 0xff55ffff),
+        draw_centered_text(self.canvas, render_text(self.font_60, 'OpenPipe', 0xff55ffff),
                            self.main.x_center, 90)
         draw.rect(self.canvas, 0x00aa00, self.start_rect)
-        draw_centered_text(self.canvas, self.font_42.render('Start', True, 0xffffffff),
-                           self.main.x_center, 250)
+        draw_centered_text(self.canvas, render_text(self.font_42, 'Start', 0xffffffff),
+                           self.main.x_center - TITLE_W // 2 - 5, 250)
+        draw.rect(self.canvas, 0x00aa00, self.picker_rect)
+        draw_centered_text(self.canvas, render_text(self.font_42, 'Levels', 0xffffffff),
+                           self.main.x_center + TITLE_W // 2, 250)
         draw.rect(self.canvas, 0x00aa00, self.level_editor)
-        draw_centered_text(self.canvas, self.font_42.render('Level Editor', True, 0xffffffff),
+        draw_centered_text(self.canvas, render_text(self.font_42, 'Level Editor', 0xffffffff),
                            self.main.x_center, 350)
         draw.rect(self.canvas, 0x00aa00, self.load_rect)
-        draw_centered_text(self.canvas, self.font_42.render('Load Level', True, 0xffffffff),
+        draw_centered_text(self.canvas, render_text(self.font_42, 'Load Level', 0xffffffff),
                            self.main.x_center - TITLE_W // 2 - 5, 450)
         draw.rect(self.canvas, 0x00aa00, self.random_rect)
-        draw_centered_text(self.canvas, self.font_42.render('Random', True, 0xffffffff),
+        draw_centered_text(self.canvas, render_text(self.font_42, 'Random', 0xffffffff),
                            self.main.x_center + TITLE_W // 2, 450)
 
+    @profiled('Game._update_board')
     def _update_board(self):
         if self.mode == mode.MENU:
             self.main_menu()
             self.core = None
             self.editor = None
             self.loader = None
+            self.picker = None
             return
 
         if self.mode == mode.EDITOR:
             self.editor.draw()
             draw.rect(self.canvas, 0x00aa00, self.next_rect)
-            draw_centered_text(self.canvas, self.font_24.render('Save', True, 0xffffffff),
+            draw_centered_text(self.canvas, render_text(self.font_24, 'Save', 0xffffffff),
                                self.main.x_center - 90, self.main.y_size - 50)
+            if self.editor.invalid_data:
+                draw_centered_text(self.canvas, render_text(self.font_24, 'Invalid Level', 0xff0000ff),
+                                   self.main.x_center, self.main.y_size - 100)
+            self._draw_verdict(True)
 
         if self.mode == mode.LOAD:
             self.loader.draw()
             draw.rect(self.canvas, 0x00aa00, self.next_rect)
-            draw_centered_text(self.canvas, self.font_24.render('Load', True, 0xffffffff),
+            draw_centered_text(self.canvas, render_text(self.font_24, 'Load', 0xffffffff),
                                self.main.x_center - 90, self.main.y_size - 50)
             if self.loader.invalid_data:
-                draw_centered_text(self.canvas, self.font_24.render('Invalid Data', True, 0xff0000ff),
+                draw_centered_text(self.canvas, render_text(self.font_24, 'Invalid Data', 0xff0000ff),
                                    self.main.x_center, self.main.y_center)
 
+        if self.mode == mode.PICKER:
+            self.picker.draw()
+
         if self.mode != mode.EDITOR and self.core is not None:
-            self.canvas.blit(self.font_24.render(f'{self.core.connected}/{self.core.required} Connected', True, 0x11ff11ff),
-                             (7, 45))
-            ticks_passed = self.main.number_tick - self.core.time_start if self.mode == mode.PLAYING else self.core.time_end - self.core.time_start
-            seconds = ticks_passed // self.main.TPS
-            time_text = f'\uf64f {seconds // 60:02d}:{seconds % 60:02d}'
-            draw_right_align_text(self.canvas, self.font_24.render(time_text, True, 0x5555ffff), self.main.x_size - 5, 5)
+            self._draw_status(True)
 
         if self.mode == mode.WIN:
-            draw_centered_text(self.canvas, self.font_42.render('PERFECT!', True, 0xff55ffff),
+            draw_centered_text(self.canvas, render_text(self.font_42, 'PERFECT!', 0xff55ffff),
                                self.main.x_center, 60)
-            if self.core.level + 1 in LEVELS and not self.core.loaded:
+            if self.core.level + 1 in self.main.levels and not self.core.loaded:
                 draw.rect(self.canvas, 0x00aa00, self.next_rect)
-                draw_centered_text(self.canvas, self.font_24.render('Next Level', True, 0xffffffff),
+                draw_centered_text(self.canvas, render_text(self.font_24, 'Next Level', 0xffffffff),
                                    self.main.x_center - 90, self.main.y_size - 50)
 
+        if self.invalid_level is not None:
+            draw_centered_text(self.canvas, render_text(self.font_24, f'Level #{self.invalid_level + 1} is damaged',
+                                                        0xff0000ff), self.main.x_center, self.main.y_size - 100)
+
         text = ''
         if self.mode == mode.PLAYING or self.mode == mode.WIN:
             text = self.core.level_name
@@ -144,100 +178,217 @@ class Game:
             text = 'Level Editor'
         if self.mode == mode.LOAD:
             text = 'Load Level'
-        self.canvas.blit(self.font_30.render(text, True, 0x11ff11ff), (5, 5))
+        if self.mode == mode.PICKER:
+            text = 'Levels'
+        self.canvas.blit(render_text(self.font_30, text, 0x11ff11ff), (5, 5))
         draw.rect(self.canvas, 0x00aa00, self.menu_rect)
-        draw_centered_text(self.canvas, self.font_24.render('Main Menu', True, 0xffffffff), self.main.x_center + 90,
+        draw_centered_text(self.canvas, render_text(self.font_24, 'Main Menu', 0xffffffff), self.main.x_center + 90,
                            self.main.y_size - 50)
 
         if self.core is not None:
             self.core.draw()
 
+    def _draw_label(self, key: str, text: str, font: pygame.font.Font, text_color: int, anchor: str,
+                    pos: tuple[int, int], force: bool) -> list[pygame.Rect]:
+        """Draws a text that changes while playing, unless `force` is set it is only redrawn if the text changed"""
+        previous = self.labels.get(key)
+        if not force and previous is not None and previous[0] == text:
+            return []
+        surface = render_text(font, text, text_color)
+        rect = surface.get_rect(**{anchor: pos})
+        rects = [rect]
+        if not force and previous is not None:
+            clear_canvas(self.canvas, previous[1])
+            rects.append(previous[1])
+        self.canvas.blit(surface, rect)
+        self.labels[key] = (text, rect)
+        return rects
+
+    def _draw_status(self, force: bool) -> list[pygame.Rect]:
+        rects = self._draw_label('connected', f'{self.core.connected}/{self.core.required} Connected', self.font_24,
+                                 0x11ff11ff, 'topleft', (7, 45), force)
+        if self.mode == mode.PLAYING:
+            seconds = int(self.main.now() - self.core.time_start)
+            time_text = f'\uf64f {seconds // 60:02d}:{seconds % 60:02d}'
+        else:
+            elapsed = self.core.time_end - self.core.time_start
+            time_text = f'\uf64f {int(elapsed) // 60:02d}:{elapsed % 60:06.3f}'
+        rects += self._draw_label('time', time_text, self.font_24, 0x5555ffff, 'topright', (self.main.x_size - 5, 5),
+                                  force)
+        return rects
+
+    def _draw_verdict(self, force: bool) -> list[pygame.Rect]:
+        result = self.editor.verdict
+        text_color = {verdict.UNIQUE: 0x11ff11ff, verdict.SOLVABLE: 0xffff55ff,
+                      verdict.CHECKING: 0xaaaaaaff}.get(result, 0xff5555ff)
+        return self._draw_label('verdict', result.value if result is not None else '', self.font_24, text_color,
+                                'center', (self.main.x_center, 120), force)
+
+    def _update_changes(self) -> list[pygame.Rect]:
+        rects = []
+        if self.mode == mode.PLAYING or self.mode == mode.WIN:
+            rects += self.core.draw_changes()
+            rects += self._draw_status(False)
+        if self.mode == mode.EDITOR:
+            rects += self.editor.draw_changes()
+            rects += self.editor.draw_cursor()
+            rects += self._draw_verdict(False)
+        if self.mode == mode.LOAD:
+            rects += self.loader.draw_cursor()
+        if self.mode == mode.PICKER:
+            rects += self.picker.draw_changes()
+        return rects
+
     def run_game(self, level: int) -> None:
-        self.core = Core(self.main, self.canvas)
-        self.core.run_game(level)
+        """Plays a level of main.levels, a damaged one in a level pack is reported and the current screen stays"""
+        core = Core(self.main, self.canvas)
+        try:
+            core.run_game(level)
+        except LevelFormatError:
+            self.invalid_level = level
+            self.redraw = True
+            return
+        self.core = core
         self.mode = mode.PLAYING
+        self.redraw = True
 
-    def run_game_special(self, data: dict) -> None:
+    def run_game_special(self, data: dict, board: Board | None = None) -> None:
         self.core = Core(self.main, self.canvas)
-        self.core.run_game_special(data)
+        self.core.run_game_special(data, board)
         self.mode = mode.PLAYING
+        self.redraw = True
 
     def run_level_editor(self) -> None:
-        self.editor = Editor(self.main, self.canvas)
+        self.editor = Editor(self.main, self.canvas, self.validator)
         self.editor.run()
         self.mode = mode.EDITOR
 
+    def run_picker(self) -> None:
+        self.picker = Picker(self.main, self.canvas, self.thumbnails)
+        self.mode = mode.PICKER
+
     def run_loader(self) -> None:
         self.loader = Loader(self.main, self.canvas)
         self.loader.run()
         self.mode = mode.LOAD
 
-    def tick_loop(self) -> None:
-        if self.mode == mode.PLAYING or self.mode == mode.WIN:
-            self.core.connected = check_number_connected(self.core.board)
+    def _save_score(self) -> None:
+        if self.main.scores is None:
+            return
+        core = self.core
+        key = level_key({'size': core.level_size, 'nodes': core.level_nodes})
+        self.main.scores.add(score(key, core.time_end - core.time_start, core.moves, time.time(),
+                                   core.level_name))
 
-            if pygame.key.get_pressed()[pygame.K_r]:
-                self.mode = mode.PLAYING
-                clear_canvas(self.canvas)
-                self.core.reload_level()
+    def update(self) -> None:
+        """Game logic that runs every fixed step of the main loop, without drawing anything"""
+        if self.mode == mode.EDITOR:
+            self.editor.update()
 
+    @profiled('Game.tick_loop')
+    def tick_loop(self) -> list[pygame.Rect]:
+        """Draws the frame, returns the areas of the screen that changed"""
+        if not self.redraw:
+            return self._update_changes()
+
+        self.redraw = False
         clear_canvas(self.canvas)
         self._update_board()
+        return [self.canvas.get_rect()]
 
+    @profiled('Game.handle_event')
     def handle_event(self, event: pygame.event.Event) -> None:
+        # the board tracks the pipes drawn while playing, anything else that isn't mouse movement redraws the screen
+        if event.type not in (pygame.MOUSEMOTION, pygame.MOUSEBUTTONUP) and not (
+                self.mode == mode.PLAYING and event.type == pygame.MOUSEBUTTONDOWN):
+            self.redraw = True
+        previous = self.mode
+
         if self.mode == mode.MENU:
             if event.type == pygame.MOUSEBUTTONDOWN:
-                mouse_pos = pygame.mouse.get_pos()
+                mouse_pos = event.pos
                 if self.start_rect.collidepoint(mouse_pos):
                     self.run_game(0)
+                if self.picker_rect.collidepoint(mouse_pos):
+                    self.run_picker()
                 if self.level_editor.collidepoint(mouse_pos):
                     self.run_level_editor()
                 if self.load_rect.collidepoint(mouse_pos):
                     self.run_loader()
+                if self.random_rect.collidepoint(mouse_pos):
+                    self.run_game_special(self.generator.get(random.choice(self.generator.sizes)))
 
         elif self.mode == mode.EDITOR:
             if event.type == pygame.MOUSEBUTTONDOWN:
-                mouse_pos = pygame.mouse.get_pos()
+                mouse_pos = event.pos
                 if self.menu_rect.collidepoint(mouse_pos):
                     self.main_menu()
                 if self.next_rect.collidepoint(mouse_pos):
-                    if pygame.scrap.lost():
-                        print(encode_data(self.editor.board, self.editor.board_name, self.editor.board_size).decode())
+                    try:
+                        data = encode_data(self.editor.board, self.editor.board_name, self.editor.board_size)
+                    except LevelFormatError:
+                        self.editor.invalid_data = True
                         return
-                    pygame.scrap.put('Plain text', encode_data(self.editor.board, self.editor.board_name, self.editor.board_size))
+                    self.editor.invalid_data = False
+                    if not self.main.clipboard or pygame.scrap.lost():
+                        print(data.decode())
+                        return
+                    pygame.scrap.put('Plain text', data)
             self.editor.handle_event(event)
 
         elif self.mode == mode.LOAD:
             if event.type == pygame.MOUSEBUTTONDOWN:
-                mouse_pos = pygame.mouse.get_pos()
+                mouse_pos = event.pos
                 if self.menu_rect.collidepoint(mouse_pos):
                     self.main_menu()
                 if self.next_rect.collidepoint(mouse_pos):
                     if not self.loader.text:
                         return
                     try:
-                        self.run_game_special(unload_data(self.loader.text.strip()))
-                    except (UnicodeDecodeError, binascii.Error):
+                        name, board = unload_board(self.loader.text.strip())
+                        self.run_game_special({'name': name, 'size': board.size, 'nodes': board.nodes()}, board)
+                    except LevelFormatError:
                         self.loader.invalid_data = True
                         self.loader.text = ''
             self.loader.handle_event(event)
 
+        elif self.mode == mode.PICKER:
+            if event.type == pygame.MOUSEBUTTONDOWN and self.menu_rect.collidepoint(event.pos):
+                self.main_menu()
+            else:
+                level = self.picker.handle_event(event)
+                if level is not None:
+                    self.run_game(level)
+
         elif self.mode == mode.WIN:
             if event.type == pygame.MOUSEBUTTONDOWN:
-                mouse_pos = pygame.mouse.get_pos()
-                if self.next_rect.collidepoint(mouse_pos) and self.core.level + 1 in LEVELS:
+                mouse_pos = event.pos
+                if self.next_rect.collidepoint(mouse_pos) and self.core.level + 1 in self.main.levels:
                     self.run_game(self.core.level + 1)
                 if self.menu_rect.collidepoint(mouse_pos):
                     self.main_menu()
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_r:
+                self.mode = mode.PLAYING
+                self.core.reload_level()
+            if self.mode == mode.WIN:
+                # the finished board can still be looked around
+                self.core.camera.handle_event(event)
 
         elif self.mode == mode.PLAYING:
             if event.type == pygame.MOUSEBUTTONDOWN:
-                mouse_pos = pygame.mouse.get_pos()
+                mouse_pos = event.pos
 
                 if self.menu_rect.collidepoint(mouse_pos):
                     self.main_menu()
 
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_r:
+                self.core.reload_level()
+
             if self.core.handle_event(event):
                 self.mode = mode.WIN
-                self.core.time_end = self.main.number_tick
+                self._save_score()
+
+        if self.mode != previous:
+            self.redraw = True
+            self.invalid_level = None
 
@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import colorsys
+import multiprocessing
+import random
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+from util import color
+
+
+MIN_PIPE = 3
+
+
+def _palette(count: int) -> list[int]:
+    colors = [getattr(color, i) for i in dir(color) if not i.startswith('__') and getattr(color, i) != color.gray]
+    seen = set(colors) | {color.gray}
+    # boards bigger than the named colors get evenly spaced hues, every pipe needs a color of its own
+    i = 0
+    while len(colors) < count:
+        if i < 8 * count:
+            r, g, b = colorsys.hsv_to_rgb((i * 0.618034) % 1, 0.55 + 0.45 * (i % 2), 1 - 0.3 * (i // 2 % 2))
+            c = int(r * 255) << 16 | int(g * 255) << 8 | int(b * 255)
+        else:
+            # rounded hues ran out, an odd stride visits every 24 bit color once
+            c = i * 0x9e3779 & 0xffffff
+        if c not in seen:
+            seen.add(c)
+            colors.append(c)
+        i += 1
+    return colors[:count]
+
+
+def _neighbours(size: int) -> list[tuple[int, ...]]:
+    return [tuple(j for j, ok in ((i - 1, i % size > 0), (i + 1, i % size < size - 1), (i - size, i >= size),
+                                  (i + size, i < size * size - size)) if ok) for i in range(size * size)]
+
+
+def _hamiltonian(size: int, rnd: random.Random, neighbours: list[tuple[int, ...]]) -> list[int]:
+    """Random path over every cell, a zigzag shuffled with backbite moves"""
+    path = [y * size + (x if y % 2 == 0 else size - 1 - x) for y in range(size) for x in range(size)]
+    pos = [0] * len(path)
+    for i, cell in enumerate(path):
+        pos[cell] = i
+
+    # the path is only turned around at the end, while `flipped` the moving end is path[0] instead of path[last], and
+    # a backbite only reverses the cells between the picked neighbour and that end
+    last = len(path) - 1
+    flipped = False
+    for _ in range(len(path) * 4):
+        if rnd.random() < 0.5:
+            flipped = not flipped
+        options = neighbours[path[0] if flipped else path[last]]
+        i = pos[options[int(rnd.random() * len(options))]]
+        if flipped:
+            if i == 1:
+                continue
+            path[:i] = path[i - 1::-1]
+            for j in range(i):
+                pos[path[j]] = j
+        else:
+            if i == last - 1:
+                continue
+            path[i + 1:] = path[:i:-1]
+            for j in range(i + 1, last + 1):
+                pos[path[j]] = j
+    if flipped:
+        path.reverse()
+    return path
+
+
+def _split(size: int, path: list[int], rnd: random.Random, neighbours: list[tuple[int, ...]]) -> list[list[int]] | None:
+    """Cuts a path into pipes that never run alongside themselves, returns None if a pipe ends up too short"""
+    pipes = [[path[0]]]
+    owner = [-1] * len(path)
+    owner[path[0]] = 0
+    longest = 2 * size
+    for cell in path[1:]:
+        pipe = pipes[-1]
+        touching = sum(owner[i] == len(pipes) - 1 for i in neighbours[cell]) > 1
+        if touching or len(pipe) >= longest or (len(pipe) >= MIN_PIPE and rnd.random() < 1 / size):
+            if len(pipe) < MIN_PIPE:
+                return None
+            pipes.append([cell])
+        else:
+            pipe.append(cell)
+        owner[cell] = len(pipes) - 1
+    return pipes if len(pipes[-1]) >= MIN_PIPE else None
+
+
+def generate(size: int, seed: int | None = None, unique: bool = False) -> dict:
+    """Generates a solvable level dict in the format taken by Core.run_game_special"""
+    return generate_solved(size, seed, unique)[0]
+
+
+def generate_solved(size: int, seed: int | None = None, unique: bool = False) -> tuple[dict, dict[int, list[tuple[int, int]]]]:
+    """Same as generate, also returns the pipes the level was cut from, in the format returned by solver.solve"""
+    if size < MIN_PIPE:
+        raise ValueError(f'board size must be at least {MIN_PIPE}')
+    seed = random.getrandbits(32) if seed is None else seed
+    rnd = random.Random(seed)
+    neighbours = _neighbours(size)
+
+    while True:
+        pipes = None
+        while pipes is None:
+            pipes = _split(size, _hamiltonian(size, rnd, neighbours), rnd, neighbours)
+
+        nodes = []
+        solution = {}
+        for pipe, c in zip(pipes, _palette(len(pipes))):
+            nodes.append(((pipe[0] % size, pipe[0] // size), c))
+            nodes.append(((pipe[-1] % size, pipe[-1] // size), c))
+            solution[c] = [(i % size, i // size) for i in pipe]
+        level = {'name': f'Random {size}x{size} #{seed}', 'size': size, 'nodes': nodes}
+
+        if not unique:
+            return level, solution
+        from solver import check_unique, status
+        if check_unique(level) == status.UNIQUE:
+            return level, solution
+
+
+@dataclass
+class GeneratorPool:
+    """Keeps a few generated levels of every size ready, filled by worker processes"""
+    sizes: tuple[int, ...] = (5, 6, 7, 8, 9)
+    buffer: int = 4
+    workers: int | None = None
+    seed: int | None = None
+    unique: bool = False
+
+    _rnd: random.Random = field(init=False)
+    _executor: ProcessPoolExecutor | None = field(init=False, default=None)
+    _ready: dict[int, deque[dict]] = field(init=False, default_factory=dict)
+    _pending: dict[int, list[Future]] = field(init=False, default_factory=dict)
+
+    def __post_init__(self):
+        self._rnd = random.Random(self.seed)
+        for i in self.sizes:
+            self._ready[i] = deque()
+            self._pending[i] = []
+
+    def start(self) -> None:
+        # spawn rather than fork, the parent process owns an SDL window
+        self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+        for i in self.sizes:
+            self._refill(i)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _collect(self, size: int) -> None:
+        pending = []
+        for future in self._pending[size]:
+            if not future.done():
+                pending.append(future)
+            elif not future.cancelled() and future.exception() is None:
+                self._ready[size].append(future.result())
+        self._pending[size] = pending
+
+    def _refill(self, size: int) -> None:
+        if self._executor is None:
+            return
+        missing = self.buffer - len(self._ready[size]) - len(self._pending[size])
+        if missing > 0:
+            self._pending[size].extend(self._executor.submit(generate, size, self._rnd.getrandbits(32), self.unique)
+                                       for _ in range(missing))
+
+    def get(self, size: int) -> dict:
+        """Returns a buffered level, only generating in this process when the workers haven't caught up"""
+        if size not in self._ready:
+            return generate(size, self._rnd.getrandbits(32), self.unique)
+        self._collect(size)
+        level = self._ready[size].popleft() if self._ready[size] else generate(size, self._rnd.getrandbits(32),
+                                                                                  self.unique)
+        self._refill(size)
+        return level
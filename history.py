@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+from array import array
+from dataclasses import dataclass
+
+import pygame
+
+from board import Board
+
+# cells per snapshot chunk, snapshots share the chunks that didn't change with the one before
+CHUNK = 256
+
+
+@dataclass
+class delta:
+    """The cells one move changed, with their colors and flags before and after it"""
+    cells: array
+    old_colors: array
+    old_flags: bytes
+    new_colors: array
+    new_flags: bytes
+
+    def __len__(self) -> int:
+        return len(self.cells)
+
+
+@dataclass
+class snapshot:
+    colors: tuple[array, ...]
+    flags: tuple[bytes, ...]
+
+
+class History:
+    """Undo and redo for a board, one entry per move.
+
+    Every write to the board between two `commit` calls is one move, kept as a delta of the cells it changed, so
+    undoing or redoing it only touches those cells. Every `interval` moves the board is also kept as a snapshot made of
+    chunks, where chunks nothing was written to are the same objects as in the snapshot before. Once the deltas hold
+    more than `limit` cells the oldest ones between two snapshots are dropped, undo still goes back through that part
+    of the history but a snapshot at a time. Ctrl+Z undoes and Ctrl+Y or Ctrl+Shift+Z redoes."""
+
+    def __init__(self, board: Board, interval: int = 32, limit: int = 200_000):
+        self.board = board
+        self.interval = interval
+        self.limit = limit
+
+        # moves[n] turns the board at position n into the board at position n + 1, None once dropped
+        self.moves: list[delta | None] = []
+        self.position = 0
+        self.snapshots: dict[int, snapshot] = {0: self._take(None, range(0, len(board), CHUNK))}
+        self.kept = 0
+        # cells the last undo or redo wrote to, with their colors and flags from before
+        self.applied: dict[int, tuple[int, int]] = {}
+        board.journal = {}
+
+    @property
+    def can_undo(self) -> bool:
+        return self.position > 0
+
+    @property
+    def can_redo(self) -> bool:
+        return self.position < len(self.moves)
+
+    def commit(self) -> bool:
+        """Ends the move being made, returns False if it didn't change the board"""
+        board = self.board
+        journal = board.journal
+        cells = sorted(i for i, (c, flags) in journal.items() if board.colors[i] != c or board.flags[i] != flags)
+        if not cells:
+            journal.clear()
+            return False
+        move = delta(array('L', cells), array('L', (journal[i][0] for i in cells)),
+                     bytes(journal[i][1] for i in cells), array('L', (board.colors[i] for i in cells)),
+                     bytes(board.flags[i] for i in cells))
+        journal.clear()
+
+        # a new move ends the moves that could have been redone
+        for i in self.moves[self.position:]:
+            self.kept -= len(i) if i is not None else 0
+        del self.moves[self.position:]
+        for i in [i for i in self.snapshots if i > self.position]:
+            del self.snapshots[i]
+
+        self.moves.append(move)
+        self.kept += len(move)
+        self.position += 1
+        if self.position % self.interval == 0:
+            self._snapshot()
+        self._trim()
+        return True
+
+    def undo(self) -> bool:
+        """Takes back the last move, returns False if there is nothing to take back"""
+        self._commit_open()
+        if not self.position:
+            return False
+        move = self.moves[self.position - 1]
+        if move is None:
+            self._restore(max(i for i in self.snapshots if i < self.position))
+        else:
+            self._apply(move.cells, move.old_colors, move.old_flags)
+            self.position -= 1
+        return True
+
+    def redo(self) -> bool:
+        """Makes the last move that was taken back again, returns False if there is none"""
+        self._commit_open()
+        if self.position == len(self.moves):
+            return False
+        move = self.moves[self.position]
+        if move is None:
+            self._restore(min(i for i in self.snapshots if i > self.position))
+        else:
+            self._apply(move.cells, move.new_colors, move.new_flags)
+            self.position += 1
+        return True
+
+    def handle_event(self, event: pygame.event.Event) -> bool:
+        """Undoes and redoes, returns True if the event was one of the keys for it"""
+        if event.type != pygame.KEYDOWN or not event.mod & pygame.KMOD_CTRL:
+            return False
+        if event.key == pygame.K_z and not event.mod & pygame.KMOD_SHIFT:
+            self.undo()
+            return True
+        if event.key == pygame.K_y or event.key == pygame.K_z:
+            self.redo()
+            return True
+        return False
+
+    def _commit_open(self) -> None:
+        """Writes that were not committed yet are a move of their own, so they are undone like any other"""
+        if self.board.journal:
+            self.commit()
+
+    def _apply(self, cells: array, colors: array, flags: bytes) -> None:
+        board = self.board
+        for i, c, f in zip(cells, colors, flags):
+            board.set(i, c, f)
+        self.applied, board.journal = board.journal, {}
+
+    def _take(self, base: snapshot | None, chunks) -> snapshot:
+        """Snapshot of the board that copies the given chunks and shares the rest with `base`"""
+        board = self.board
+        colors = list(base.colors) if base is not None else [None] * -(-len(board) // CHUNK)
+        flags = list(base.flags) if base is not None else [None] * len(colors)
+        for start in chunks:
+            n = start // CHUNK
+            part_colors, part_flags = board.colors[start:start + CHUNK], bytes(board.flags[start:start + CHUNK])
+            if base is None or part_colors != colors[n] or part_flags != flags[n]:
+                colors[n], flags[n] = part_colors, part_flags
+        return snapshot(tuple(colors), tuple(flags))
+
+    def _snapshot(self) -> None:
+        last = max(i for i in self.snapshots if i <= self.position)
+        moves = self.moves[last:self.position]
+        if any(i is None for i in moves):
+            chunks = range(0, len(self.board), CHUNK)
+        else:
+            chunks = sorted({i // CHUNK * CHUNK for move in moves for i in move.cells})
+        self.snapshots[self.position] = self._take(self.snapshots[last], chunks)
+
+    def _restore(self, position: int) -> None:
+        """Moves between two snapshots, only going through the chunks that differ between them"""
+        current, target = self.snapshots[self.position], self.snapshots[position]
+        board = self.board
+        for n, (colors, flags) in enumerate(zip(target.colors, target.flags)):
+            if colors is current.colors[n] and flags is current.flags[n]:
+                continue
+            start = n * CHUNK
+            for j, (c, f) in enumerate(zip(colors, flags), start):
+                board.set(j, c, f)
+        self.applied, board.journal = board.journal, {}
+        self.position = position
+
+    def _trim(self) -> None:
+        """Drops the oldest deltas that lie between two snapshots until at most `limit` cells are kept"""
+        keys = sorted(self.snapshots)
+        for start, end in zip(keys, keys[1:]):
+            if self.kept <= self.limit or end > self.position:
+                return
+            for n in range(start, end):
+                if self.moves[n] is not None:
+                    self.kept -= len(self.moves[n])
+                    self.moves[n] = None
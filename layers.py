@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass, field
+
+import pygame
+from pygame import draw
+
+import raster
+from assets import ASSETS
+from board import Board
+from camera import Camera, DETAIL_BOX, draw_colors
+from util import clear_canvas, draw_centered_text, render_text, grid, STRICT
+
+TRANSPARENT = (0, 0, 0, 0)
+
+
+def opaque(c: int) -> tuple[int, int, int]:
+    """A 0xRRGGBB color for surfaces with per pixel alpha, which would read the int as fully transparent"""
+    return c >> 16 & 0xff, c >> 8 & 0xff, c & 0xff
+
+
+@dataclass
+class BoardLayers:
+    """Cached surfaces a board is put together from, covering the camera view and its frame.
+
+    `static` holds what only changes with the level or the camera, `pipes` the colors that change while playing and
+    `overlay` the markers drawn over them. The last two are transparent wherever they have nothing to show, so any part
+    of the board is redrawn with three blits. `state` is whatever the layers were built for, when it changes they
+    have to be built again. Boards zoomed out too far for markers go without an overlay."""
+    area: pygame.Rect
+    state: tuple
+    markers: bool = True
+
+    static: pygame.Surface = field(init=False)
+    pipes: pygame.Surface = field(init=False)
+    overlay: pygame.Surface | None = field(init=False, default=None)
+
+    def __post_init__(self):
+        self.static = pygame.Surface(self.area.size)
+        clear_canvas(self.static)
+        self.pipes = pygame.Surface(self.area.size, pygame.SRCALPHA)
+        self.pipes.fill(TRANSPARENT)
+        if self.markers:
+            self.overlay = pygame.Surface(self.area.size, pygame.SRCALPHA)
+            self.overlay.fill(TRANSPARENT)
+
+    def local(self, layout: grid) -> grid:
+        """The layout moved into the coordinates of the layers"""
+        view = layout.view.move(-self.area.x, -self.area.y) if layout.view is not None else None
+        return grid(layout.x - self.area.x, layout.y - self.area.y, layout.box_size, layout.size, view)
+
+    def set_clip(self, rect: pygame.Rect | None) -> None:
+        for i in (self.static, self.pipes, self.overlay):
+            if i is not None:
+                i.set_clip(rect)
+
+    def clear(self, rect: pygame.Rect) -> None:
+        """Empties the pipe and overlay layers inside a rect in layer coordinates, which has to be inside the clip
+        area, see grid.visible_rect"""
+        self.pipes.fill(TRANSPARENT, rect)
+        if self.overlay is not None:
+            self.overlay.fill(TRANSPARENT, rect)
+
+    def compose(self, canvas: pygame.Surface, rect: pygame.Rect | None = None) -> pygame.Rect:
+        """Copies the layers to the canvas, only inside `rect` in canvas coordinates if given, returns the drawn area"""
+        rect = self.area.copy() if rect is None else rect.clip(self.area)
+        source = rect.move(-self.area.x, -self.area.y)
+        canvas.blit(self.static, rect, source)
+        canvas.blit(self.pipes, rect, source)
+        if self.overlay is not None:
+            canvas.blit(self.overlay, rect, source)
+        return rect
+
+
+def marker_font(box_size: int) -> pygame.font.Font:
+    """Font of the text on endpoints, fitted to cells too small for the usual size"""
+    return ASSETS.font(30 if box_size >= 40 else box_size * 3 // 4)
+
+
+@dataclass
+class BoardRenderer:
+    """Draws a board seen through a camera on BoardLayers, for the screens that show one.
+
+    A screen only says how its cells look: `draw_cell` draws one cell on layers that were just cleared there,
+    `draw_arrays` does the same for every visible cell at once from the numpy arrays of raster.board_arrays and
+    `marker` is the text on an endpoint with the given flags, which is drawn over both. Cells from `highlighted` are
+    drawn on their own after the arrays. The layers are built again when the camera or the raster changed, otherwise
+    only the cells the board reports as changed are redrawn."""
+    board: Board
+    camera: Camera
+    draw_cell: Callable[[BoardLayers, int, grid], None]
+    draw_arrays: Callable[[BoardLayers, grid, object, object], None]
+    marker: Callable[[int], str]
+    highlighted: Callable[[], Iterable[int]] = tuple
+
+    layers: BoardLayers | None = field(init=False, default=None)
+
+    def _state(self, name: str) -> tuple:
+        camera = self.camera
+        return tuple(camera.view), camera.box_size, camera.x, camera.y, name
+
+    def redraw_cell(self, i: int, local: grid) -> None:
+        rect = local.cell_rect(i)
+        self.layers.clear(local.visible_rect(i))
+        self.draw_cell(self.layers, i, local)
+        flags = self.board.flags[i]
+        if self.layers.overlay is not None and flags & STRICT:
+            text = render_text(marker_font(local.box_size), self.marker(flags), 0x000000)
+            draw_centered_text(self.layers.overlay, text, rect.centerx, rect.centery)
+
+    def _build(self, name: str) -> None:
+        camera = self.camera
+        self.layers = BoardLayers(camera.view.inflate(10, 10), self._state(name), camera.box_size >= DETAIL_BOX)
+        local = self.layers.local(camera.grid)
+        draw.rect(self.layers.static, 0xffffff, local.rect.clip(local.view).inflate(10, 10), 5)
+        self.layers.set_clip(local.view)
+
+        self.board.take_changes()
+        if local.box_size < DETAIL_BOX:
+            draw_colors(self.layers.pipes, self.board.colors, local)
+            return
+        if name != 'numpy':
+            for i in local.visible():
+                self.redraw_cell(i, local)
+            return
+        colors, flags = raster.board_arrays(self.board)
+        self.draw_arrays(self.layers, local, colors, flags)
+        font = marker_font(local.box_size)
+        cells = raster.visible_cells(flags & STRICT != 0, local).tolist()
+        marks = ((i, render_text(font, self.marker(self.board.flags[i]), 0x000000)) for i in cells)
+        raster.draw_markers(self.layers.overlay, marks, local)
+        for i in self.highlighted():
+            self.redraw_cell(i, local)
+
+    def _update(self) -> list[pygame.Rect]:
+        """Redraws the changed cells on the layers, returns the areas of the canvas they cover"""
+        local = self.layers.local(self.camera.grid)
+        rects = []
+        for i in self.board.take_changes():
+            rect = local.visible_rect(i)
+            if rect.w and rect.h:
+                self.redraw_cell(i, local)
+                rects.append(rect.move(self.layers.area.topleft))
+        return rects
+
+    def draw(self, canvas: pygame.Surface, name: str) -> None:
+        """Draws the whole board with the raster called `name`, building the layers again if needed"""
+        self.camera.moved = False
+        if self.layers is None or self.layers.state != self._state(name):
+            self._build(name)
+        else:
+            self._update()
+        self.layers.compose(canvas)
+
+    def draw_changes(self, canvas: pygame.Surface, name: str) -> list[pygame.Rect]:
+        """Redraws the cells that changed or the whole board after the camera moved, returns the updated areas"""
+        if self.camera.take_moved():
+            self.draw(canvas, name)
+            return [self.layers.area]
+        return [self.layers.compose(canvas, rect) for rect in self._update()]
@@ -10,7 +10,9 @@ from pygame import draw
 if TYPE_CHECKING:
     from main import Main
 
-from util import clear_canvas
+from assets import ASSETS
+from profiler import profiled
+from util import clear_canvas, render_text
 
 
 @dataclass
@@ -21,6 +23,7 @@ class Loader:
     text: str = field(init=False, default='Enter the data here.')
 
     invalid_data: bool = field(init=False, default=False)
+    blink: bool = field(init=False, default=False)
 
     font_24: pygame.font.Font = field(init=False)
     font_30: pygame.font.Font = field(init=False)
@@ -28,10 +31,10 @@ class Loader:
     font_60: pygame.font.Font = field(init=False)
 
     def __post_init__(self):
-        self.font_24 = pygame.font.Font('assets/jetbrainsmononerd.ttf', 24)
-        self.font_30 = pygame.font.Font('assets/jetbrainsmononerd.ttf', 30)
-        self.font_42 = pygame.font.Font('assets/jetbrainsmononerd.ttf', 42)
-        self.font_60 = pygame.font.Font('assets/jetbrainsmononerd.ttf', 60)
+        self.font_24 = ASSETS.font(24)
+        self.font_30 = ASSETS.font(30)
+        self.font_42 = ASSETS.font(42)
+        self.font_60 = ASSETS.font(60)
 
     @property
     def factor(self) -> int:
@@ -41,12 +44,17 @@ class Loader:
     def textbox_rect(self) -> pygame.Rect:
         return pygame.Rect(self.main.x_center - 210 * self.factor, 55, 2 * 210 * self.factor, 2 * 25)
 
-    def _update_board(self) -> None:
+    def _draw_text(self) -> None:
         text = self.text[-28 * self.factor:]
-        draw.rect(self.canvas, 0xffffff, self.textbox_rect, 3)
-        self.canvas.blit(self.font_24.render(text + '_' if time.time() % 1 > 0.5 else text, True, 0xffffffff),
+        self.blink = time.time() % 1 > 0.5
+        self.canvas.blit(render_text(self.font_24, text + '_' if self.blink else text, 0xffffffff),
                          (self.main.x_center - 210 * self.factor + 10, 65))
 
+    @profiled('Loader._update_board')
+    def _update_board(self) -> None:
+        draw.rect(self.canvas, 0xffffff, self.textbox_rect, 3)
+        self._draw_text()
+
     def run(self):
         clear_canvas(self.canvas)
         self._update_board()
@@ -54,6 +62,15 @@ class Loader:
     def draw(self):
         self._update_board()
 
+    def draw_cursor(self) -> list[pygame.Rect]:
+        """Redraws the text box when the cursor blinks, returns the updated areas"""
+        if self.blink == (time.time() % 1 > 0.5):
+            return []
+        clear_canvas(self.canvas, self.textbox_rect.inflate(-6, -6))
+        self._draw_text()
+        return [self.textbox_rect]
+
+    @profiled('Loader.handle_event')
     def handle_event(self, event: pygame.event.Event):
 
         if event.type == pygame.KEYDOWN:
@@ -63,7 +80,7 @@ class Loader:
             if event.key == pygame.K_BACKSPACE:
                 self.text = self.text[:-1]
 
-            elif event.key == pygame.K_v and event.mod & pygame.KMOD_CTRL:
+            elif event.key == pygame.K_v and event.mod & pygame.KMOD_CTRL and self.main.clipboard:
                 data = pygame.scrap.get('text/plain;charset=utf-8')
                 if data:
                     self.text += data.decode('utf-8')
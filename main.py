@@ -1,5 +1,8 @@
 from __future__ import annotations
 
+import argparse
+import time
+from collections.abc import Callable, Mapping
 from dataclasses import dataclass, field
 from typing import ClassVar
 
@@ -8,16 +11,50 @@ import pygame
 
 __version__ = '0.0.1'
 
+from assets import ASSETS
+from data.level import LEVELS
+from data.scores import ScoreStore
 from game import Game
+from profiler import PROFILER
+from raster import RASTERS, available, next_raster
+from util import coalesce_motion
+
+
+@dataclass
+class timing:
+    """Rates the main loop reached over the last second"""
+    fps: float = 0.0
+    tps: float = 0.0
+    # fixed steps dropped because the loop fell more than MAX_STEPS behind
+    skipped: int = 0
+
+    def __str__(self) -> str:
+        return f'{self.fps:.0f} fps {self.tps:.0f} tps, {self.skipped} steps skipped'
 
 
 @dataclass
 class Main:
+    """Window and main loop.
+
+    Game logic runs in fixed steps of 1 / TPS seconds on a monotonic clock, however often frames are drawn. Frames are
+    drawn `fps` times a second, as often as possible if it is None, and `vsync` lets the display pace them instead,
+    `fps` is then the refresh rate dropped frames are counted against.
+    `raster` is how whole boards are drawn, one of raster.RASTERS, F4 switches between the ones that can be used."""
     TPS: ClassVar[int] = 60
+    MAX_STEPS: ClassVar[int] = 5
     x_size: int = 800
     y_size: int = 600
+    # the LEVELS dict or a data.storage.LevelPack
+    levels: Mapping[int, dict] = field(default_factory=lambda: LEVELS)
+    fps: int | None = 60
+    vsync: bool = False
+    raster: str = 'cells'
+    clock: Callable[[], float] = time.perf_counter
 
     number_tick: int = field(init=False, default=0)
+    clipboard: bool = field(init=False, default=False)
+    scores: ScoreStore | None = field(init=False, default=None)
+    stats: timing = field(init=False, default_factory=timing)
 
     @property
     def x_center(self) -> int:
@@ -27,33 +64,155 @@ class Main:
     def y_center(self) -> int:
         return self.y_size // 2
 
+    def now(self) -> float:
+        """Seconds on the clock everything in the game is timed with"""
+        return self.clock()
+
+    def _open_window(self) -> pygame.Surface:
+        if self.vsync:
+            try:
+                return pygame.display.set_mode((self.x_size, self.y_size), pygame.RESIZABLE, vsync=1)
+            except pygame.error as e:
+                print(f'vsync not available: {e}')
+                self.vsync = False
+        return pygame.display.set_mode((self.x_size, self.y_size), pygame.RESIZABLE)
+
     def main(self) -> None:
+        ASSETS.preload()
+        if not available(self.raster):
+            print(f'{self.raster} raster not available, drawing boards cell by cell')
+            self.raster = 'cells'
+        PROFILER.fps = self.fps or 0
         pygame.init()
         # logo = pygame.image.load('assets/logo.png')
         # pygame.display.set_icon(logo)
         pygame.display.set_caption(f'OpenPipe {__version__}')
-        canvas = pygame.display.set_mode((self.x_size, self.y_size), pygame.RESIZABLE)
-        pygame.scrap.init()
-        pygame.scrap.set_mode(pygame.SCRAP_CLIPBOARD)
-        clock = pygame.time.Clock()
+        canvas = self._open_window()
+        try:
+            pygame.scrap.init()
+            pygame.scrap.set_mode(pygame.SCRAP_CLIPBOARD)
+            self.clipboard = True
+        except pygame.error:
+            self.clipboard = False
+        self.scores = ScoreStore()
 
         game = Game(self, canvas)
+        game.generator.start()
         game.main_menu()
 
+        step = 1 / self.TPS
+        frame = 1 / self.fps if self.fps and not self.vsync else 0.0
+        previous = second = next_frame = self.now()
+        lag = 0.0
+        frames = steps = 0
         while True:
-            self.number_tick += 1
-            clock.tick(self.TPS)
-            game.tick_loop()
-            pygame.display.update()
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    pygame.quit()
-                    return
-                if event.type == pygame.VIDEORESIZE:
-                    self.x_size = event.w
-                    self.y_size = event.h
-                game.handle_event(event)
+            now = self.now()
+            lag += now - previous
+            previous = now
+
+            with PROFILER.section('Main.handle_events'):
+                running = self.handle_events(game, pygame.event.get())
+            if not running:
+                if PROFILER.recording:
+                    print(f'trace written to {PROFILER.stop_recording()}')
+                game.generator.shutdown()
+                game.validator.shutdown()
+                game.thumbnails.close()
+                self.scores.close()
+                pygame.quit()
+                return
+
+            caught_up = 0
+            while lag >= step:
+                if caught_up == self.MAX_STEPS:
+                    # after a long stall the missed steps are dropped instead of run all at once
+                    self.stats.skipped += int(lag // step)
+                    lag %= step
+                    break
+                self.number_tick += 1
+                game.update()
+                lag -= step
+                caught_up += 1
+                steps += 1
+
+            rects = []
+            if now >= next_frame:
+                PROFILER.frame()
+                rects = game.tick_loop()
+                rects += PROFILER.draw(canvas)
+                if rects:
+                    with PROFILER.section('display.update'):
+                        pygame.display.update(rects)
+                frames += 1
+                next_frame = max(next_frame + frame, now)
+
+            if now - second >= 1:
+                self.stats.fps = frames / (now - second)
+                self.stats.tps = steps / (now - second)
+                PROFILER.status = str(self.stats)
+                second = now
+                frames = steps = 0
+
+            if self.vsync:
+                # only a display update waits for the display, idle frames wait for the next step instead of spinning
+                wait = 0.0 if rects else now + step - lag - self.now()
+            elif self.fps:
+                wait = min(next_frame, now + step - lag) - self.now()
+            else:
+                wait = 0.0
+            if wait > 0:
+                time.sleep(wait)
+
+    def handle_events(self, game: Game, events: list[pygame.event.Event]) -> bool:
+        """Passes events on to the game, returns False once the game should quit"""
+        for event in coalesce_motion(events):
+            if event.type == pygame.QUIT:
+                return False
+            if event.type == pygame.VIDEORESIZE:
+                self.x_size = event.w
+                self.y_size = event.h
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                if PROFILER.overlay:
+                    PROFILER.hide()
+                    game.redraw = True
+                else:
+                    PROFILER.overlay = True
+                continue
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_F2:
+                if PROFILER.recording:
+                    print(f'trace written to {PROFILER.stop_recording()}')
+                    # the overlay loses its recording line, the rows left behind by it are painted over
+                    game.redraw = True
+                else:
+                    PROFILER.start_recording()
+                continue
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_F4:
+                # the board layers are built again for the new raster, they keep it in their state
+                self.raster = next_raster(self.raster)
+                print(f'drawing boards with the {self.raster} raster')
+                game.redraw = True
+                continue
+            game.handle_event(event)
+        return True
 
 
 if __name__ == '__main__':
-    Main().main()
+    parser = argparse.ArgumentParser(description=f'OpenPipe {__version__}')
+    parser.add_argument('--pack', help='play the levels of this level pack instead of the built in ones')
+    parser.add_argument('--fps', type=int, default=60,
+                        help='frames drawn per second, 60 by default, with --vsync the refresh rate of the display')
+    parser.add_argument('--uncapped', action='store_true', help='draw frames as fast as possible')
+    parser.add_argument('--vsync', action='store_true', help='draw a frame every display refresh')
+    parser.add_argument('--raster', choices=RASTERS, default='cells',
+                        help='how boards are drawn, cell by cell or as numpy arrays, F4 switches while playing')
+    args = parser.parse_args()
+    levels = LEVELS
+    if args.pack:
+        from data.codec import LevelFormatError
+        from data.storage import LevelPack
+        try:
+            levels = LevelPack(args.pack)
+        except (OSError, LevelFormatError) as e:
+            parser.error(f'can\'t open {args.pack}: {e}')
+    Main(levels=levels, fps=None if args.uncapped else args.fps, vsync=args.vsync,
+         raster=args.raster).main()
@@ -0,0 +1,165 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
+
+import pygame
+from pygame import draw
+
+if TYPE_CHECKING:
+    from main import Main
+
+from assets import ASSETS
+from profiler import profiled
+from thumbnails import ThumbnailCache, THUMB
+from util import clear_canvas, draw_centered_text, render_text
+
+TILE_W = 130
+TILE_H = 150
+SCROLL_STEP = 40
+
+
+@dataclass
+class Picker:
+    main: Main
+    canvas: pygame.Surface
+    thumbnails: ThumbnailCache
+
+    scroll: int = field(init=False, default=0)
+    ids: list[int] = field(init=False)
+    positions: dict[int, int] = field(init=False)
+    names: dict[str, str] = field(init=False, default_factory=dict)
+
+    font_18: pygame.font.Font = field(init=False)
+    font_24: pygame.font.Font = field(init=False)
+
+    def __post_init__(self):
+        self.font_18 = ASSETS.font(18)
+        self.font_24 = ASSETS.font(24)
+        self.ids = list(self.main.levels)
+        self.positions = {level: n for n, level in enumerate(self.ids)}
+        if self.main.scores is not None:
+            # the best times are read on the scores thread, the tiles show them once take_loaded says so
+            self.main.scores.load()
+
+    @property
+    def area(self) -> pygame.Rect:
+        return pygame.Rect(10, 50, self.main.x_size - 20, self.main.y_size - 140)
+
+    @property
+    def columns(self) -> int:
+        return max(1, self.area.w // TILE_W)
+
+    @property
+    def max_scroll(self) -> int:
+        rows = -(-len(self.ids) // self.columns)
+        return max(0, rows * TILE_H - self.area.h)
+
+    def tile_rect(self, n: int) -> pygame.Rect:
+        area = self.area
+        columns = self.columns
+        left = area.centerx - columns * TILE_W // 2
+        return pygame.Rect(left + n % columns * TILE_W, area.y + n // columns * TILE_H - self.scroll, TILE_W, TILE_H)
+
+    def visible(self) -> range:
+        """Positions in `ids` of the tiles that are at least partly on screen"""
+        first = self.scroll // TILE_H * self.columns
+        last = (self.scroll + self.area.h) // TILE_H * self.columns + self.columns
+        return range(first, min(last, len(self.ids)))
+
+    def _name(self, name: str) -> str:
+        """The name cut down to the width of a tile"""
+        fitted = self.names.get(name)
+        if fitted is None:
+            fitted = name
+            while len(fitted) > 1 and self.font_18.size(fitted)[0] > TILE_W - 10:
+                fitted = fitted[:-1]
+            self.names[name] = fitted
+        return fitted
+
+    def _draw_tile(self, n: int) -> pygame.Rect:
+        rect = self.tile_rect(n)
+        level = self.ids[n]
+        clear_canvas(self.canvas, rect)
+        thumb = pygame.Rect(0, 0, THUMB, THUMB)
+        thumb.midtop = rect.centerx, rect.y + 5
+        surface = self.thumbnails.get(level)
+        if surface is None:
+            draw.rect(self.canvas, 0x303030, thumb, 2)
+        else:
+            self.canvas.blit(surface, thumb)
+
+        info = self.thumbnails.info(level)
+        name = self._name(info[1] if info is not None and info[1] else f'#{level + 1}')
+        draw_centered_text(self.canvas, render_text(self.font_18, name, 0xffffffff), rect.centerx, thumb.bottom + 14)
+        best = self.main.scores.best(info[0]) if info is not None and self.main.scores is not None else None
+        text = f'{int(best.seconds) // 60:02d}:{best.seconds % 60:05.2f}' if best is not None else '--:--'
+        draw_centered_text(self.canvas, render_text(self.font_18, text, 0x5555ffff), rect.centerx, thumb.bottom + 34)
+        return rect
+
+    def _draw_scrollbar(self) -> None:
+        area = self.area
+        bar = pygame.Rect(area.right - 4, area.y, 4, area.h)
+        clear_canvas(self.canvas, bar)
+        if self.max_scroll:
+            height = max(20, area.h * area.h // (area.h + self.max_scroll))
+            draw.rect(self.canvas, 0x555555, (bar.x, area.y + (area.h - height) * self.scroll // self.max_scroll,
+                                              bar.w, height))
+
+    @profiled('Picker._update_board')
+    def _update_board(self) -> None:
+        self.scroll = min(self.scroll, self.max_scroll)
+        visible = self.visible()
+        self.canvas.set_clip(self.area)
+        clear_canvas(self.canvas, self.area)
+        for n in visible:
+            self._draw_tile(n)
+        self._draw_scrollbar()
+        self.canvas.set_clip(None)
+        self.thumbnails.request([self.ids[n] for n in visible])
+        if not self.ids:
+            draw_centered_text(self.canvas, render_text(self.font_24, 'No levels', 0xffffffff),
+                               self.main.x_center, self.main.y_center)
+
+    def draw(self):
+        self._update_board()
+
+    def draw_changes(self) -> list[pygame.Rect]:
+        """Redraws the tiles whose thumbnails or best times finished loading, returns the updated areas"""
+        visible = self.visible()
+        tiles = [self.positions[i] for i in self.thumbnails.take_ready() if self.positions.get(i) in visible]
+        if self.main.scores is not None and self.main.scores.take_loaded():
+            tiles = list(visible)
+        if not tiles:
+            return []
+        area = self.area
+        self.canvas.set_clip(area)
+        rects = [self._draw_tile(n).clip(area) for n in tiles]
+        self.canvas.set_clip(None)
+        return rects
+
+    @profiled('Picker.handle_event')
+    def handle_event(self, event: pygame.event.Event) -> int | None:
+        """Scrolls the list, returns the id of the level that was clicked"""
+        if event.type == pygame.MOUSEWHEEL:
+            self.scroll -= event.y * SCROLL_STEP
+        if event.type == pygame.KEYDOWN:
+            if event.key == pygame.K_DOWN:
+                self.scroll += TILE_H
+            if event.key == pygame.K_UP:
+                self.scroll -= TILE_H
+            if event.key == pygame.K_PAGEDOWN:
+                self.scroll += self.area.h
+            if event.key == pygame.K_PAGEUP:
+                self.scroll -= self.area.h
+            if event.key == pygame.K_HOME:
+                self.scroll = 0
+            if event.key == pygame.K_END:
+                self.scroll = self.max_scroll
+        self.scroll = max(0, min(self.scroll, self.max_scroll))
+
+        if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1 and self.area.collidepoint(event.pos):
+            for n in self.visible():
+                if self.tile_rect(n).collidepoint(event.pos):
+                    return self.ids[n]
+        return None
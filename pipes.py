@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+from collections.abc import Iterable
+
+from board import Board
+from util import color, FILLED, STRICT, CONNECTED, LINK
+
+LINK_SHIFT = 3
+
+
+def link(i: int, previous: int, size: int) -> int:
+    """LINK flag bits of a pipe cell that follows `previous`"""
+    step = previous - i
+    return (1 if step == size else 2 if step == -size else 3 if step == 1 else 4) << LINK_SHIFT
+
+
+def linked(i: int, flags: int, size: int) -> int:
+    """The cell a pipe cell follows"""
+    return i + (size, -size, 1, -1)[((flags & LINK) >> LINK_SHIFT) - 1]
+
+
+class Pipes:
+    """The pipe of every color as the ordered cells from the endpoint it was started at to its head.
+
+    `index` maps every cell on a pipe to its place in it, so finding, extending and cutting a pipe only touches the
+    cells that change. A connected pipe ends on its other endpoint. Every cell after the first also has the direction
+    to the one before in its LINK flags, so the order survives writes that go around this class, like an undo, and
+    `rebuild` reads the pipes of the colors they touched back from the board."""
+
+    def __init__(self, board: Board):
+        self.board = board
+        self.paths: dict[int, list[int]] = {}
+        self.index: dict[int, int] = {}
+
+    def path(self, c: int) -> list[int]:
+        return self.paths.get(c, [])
+
+    def head(self, c: int) -> int | None:
+        path = self.paths.get(c)
+        return path[-1] if path else None
+
+    def color_at(self, i: int) -> int | None:
+        """Color of the pipe running through a cell"""
+        return self.board.colors[i] if i in self.index else None
+
+    def connected(self, c: int) -> bool:
+        path = self.paths.get(c)
+        return path is not None and len(path) > 1 and self.board.flags[path[-1]] & STRICT != 0
+
+    def start(self, i: int) -> None:
+        """Starts a new pipe from an endpoint, removing the one the color had"""
+        c = self.board.colors[i]
+        self.clear(c)
+        self.paths[c] = [i]
+        self.index[i] = 0
+
+    def grab(self, i: int) -> None:
+        """Carries on drawing from a cell of a pipe, everything after it is removed"""
+        self.cut(self.board.colors[i], self.index[i] + 1)
+
+    def extend(self, c: int, i: int) -> bool:
+        """Moves the head of a pipe into a neighbouring cell, returns True if that connected it.
+
+        Going back onto the pipe removes what came after that cell, crossing another pipe cuts it where it was
+        crossed. Cells that aren't next to the head and endpoints of other colors are left alone."""
+        board = self.board
+        path = self.paths.get(c)
+        if not path or self.connected(c) or i not in board.neighbours[path[-1]]:
+            return False
+        if i in self.index and board.colors[i] == c:
+            self.cut(c, self.index[i] + 1)
+            return False
+        flags = board.flags[i]
+        if flags & STRICT and (board.colors[i] != c or i == path[0]):
+            return False
+        if i in self.index:
+            self.cut(board.colors[i], self.index[i])
+            flags = board.flags[i]
+
+        if flags & STRICT:
+            board.set(path[0], c, board.flags[path[0]] | CONNECTED)
+            flags |= CONNECTED
+        board.set(i, c, flags & ~LINK | FILLED | link(i, path[-1], board.size))
+        self.index[i] = len(path)
+        path.append(i)
+        return flags & STRICT != 0
+
+    def cut(self, c: int, length: int) -> None:
+        """Shortens a pipe to its first `length` cells, emptying the rest"""
+        board = self.board
+        path = self.paths.get(c)
+        if not path or length >= len(path):
+            return
+        if self.connected(c):
+            # the far endpoint stays but neither end is connected anymore
+            end = path.pop()
+            del self.index[end]
+            board.set(end, c, board.flags[end] & ~(CONNECTED | LINK))
+            board.set(path[0], c, board.flags[path[0]] & ~CONNECTED)
+        for i in path[length:]:
+            del self.index[i]
+            if board.flags[i] & STRICT:
+                board.set(i, c, board.flags[i] & ~(CONNECTED | LINK))
+            else:
+                board.set(i, color.gray, board.flags[i] & ~(FILLED | LINK))
+        del path[length:]
+        if not path:
+            del self.paths[c]
+
+    def clear(self, c: int) -> None:
+        """Removes the pipe of a color, its endpoints stay and are marked as not connected"""
+        self.cut(c, 0)
+
+    def rebuild(self, colors: Iterable[int]) -> None:
+        """Reads the pipes of these colors back from the LINK flags on the board"""
+        board = self.board
+        size = board.size
+        colors = [c for c in set(colors) if c != color.gray]
+        for c in colors:
+            for i in self.paths.pop(c, ()):
+                del self.index[i]
+
+        for c in colors:
+            cells = [i for i in board.by_color.get(c, ()) if board.flags[i] & LINK]
+            if not cells:
+                continue
+            followed = {linked(i, board.flags[i], size) for i in cells}
+            # the head is the one cell no other cell follows
+            path = [next(i for i in cells if i not in followed)]
+            while board.flags[path[-1]] & LINK:
+                path.append(linked(path[-1], board.flags[path[-1]], size))
+            path.reverse()
+            self.paths[c] = path
+            for n, i in enumerate(path):
+                self.index[i] = n
@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+import pygame
+
+from assets import ASSETS
+
+
+@dataclass
+class Profiler:
+    """Times sections of every frame, for the overlay and for trace files in the Chrome trace event format.
+
+    The trace can be opened in chrome://tracing or https://ui.perfetto.dev. While neither the overlay nor a trace is
+    on, sections cost a single attribute check."""
+    fps: int = 60
+    history: int = 300
+
+    overlay: bool = field(init=False, default=False)
+    recording: bool = field(init=False, default=False)
+    frames: deque[float] = field(init=False)
+    dropped: int = field(init=False, default=0)
+    # extra line at the bottom of the overlay
+    status: str = field(init=False, default='')
+    totals: dict[str, float] = field(init=False, default_factory=dict)
+    sections: dict[str, deque[float]] = field(init=False, default_factory=dict)
+    trace: deque[dict] = field(init=False, default_factory=lambda: deque(maxlen=500_000))
+
+    _frame_start: int = field(init=False, default=0)
+    _rect: pygame.Rect | None = field(init=False, default=None)
+
+    def __post_init__(self):
+        self.frames = deque(maxlen=self.history)
+
+    @property
+    def active(self) -> bool:
+        return self.overlay or self.recording
+
+    def frame(self) -> None:
+        """Marks the start of a new frame"""
+        now = time.perf_counter_ns()
+        if self._frame_start and self.active:
+            duration = (now - self._frame_start) / 1e9
+            self.frames.append(duration)
+            # anything longer than one and a half frames missed at least one, uncapped nothing is missed
+            if self.fps:
+                self.dropped += max(0, round(duration * self.fps) - 1)
+            for name, total in self.totals.items():
+                self.sections.setdefault(name, deque(maxlen=self.history)).append(total)
+            if self.recording:
+                self.trace.append({'name': 'frame', 'ph': 'X', 'ts': self._frame_start / 1e3,
+                                   'dur': (now - self._frame_start) / 1e3, 'pid': os.getpid(),
+                                   'tid': threading.get_ident()})
+        self.totals = dict.fromkeys(self.totals, 0.0)
+        self._frame_start = now
+
+    @contextmanager
+    def section(self, name: str):
+        if not self.active:
+            yield
+            return
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            end = time.perf_counter_ns()
+            self.totals[name] = self.totals.get(name, 0.0) + (end - start) / 1e9
+            if self.recording:
+                self.trace.append({'name': name, 'ph': 'X', 'ts': start / 1e3, 'dur': (end - start) / 1e3,
+                                   'pid': os.getpid(), 'tid': threading.get_ident()})
+
+    def percentile(self, p: float) -> float:
+        if not self.frames:
+            return 0.0
+        frames = sorted(self.frames)
+        return frames[min(len(frames) - 1, int(p / 100 * len(frames)))]
+
+    def start_recording(self) -> None:
+        self.trace.clear()
+        self.recording = True
+
+    def stop_recording(self, path: str | None = None) -> str:
+        """Stops recording and writes the trace, returns the path of the file"""
+        self.recording = False
+        path = path or time.strftime('trace-%Y%m%d-%H%M%S.json')
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': list(self.trace), 'displayTimeUnit': 'ms'}, f)
+        self.trace.clear()
+        return path
+
+    def draw(self, canvas: pygame.Surface) -> list[pygame.Rect]:
+        """Draws the overlay in the bottom left corner, returns the areas of the screen that changed"""
+        if not self.overlay:
+            return []
+        font = ASSETS.font(14)
+        lines = [f'frame p50 {self.percentile(50) * 1e3:5.1f}  p95 {self.percentile(95) * 1e3:5.1f}  '
+                 f'p99 {self.percentile(99) * 1e3:5.1f} ms',
+                 f'dropped {self.dropped} at {self.fps or "uncapped"} fps']
+        for name, times in sorted(self.sections.items()):
+            lines.append(f'{name:<22} {sum(times) / len(times) * 1e3:6.2f} ms')
+        if self.recording:
+            lines.append(f'recording {len(self.trace)} events')
+        if self.status:
+            lines.append(self.status)
+
+        height = font.get_linesize()
+        rect = pygame.Rect(5, canvas.get_height() - 10 - height * len(lines), 330, height * len(lines) + 5)
+        canvas.fill(0x000000, rect)
+        for i, line in enumerate(lines):
+            # numbers change every frame, so these skip the shared text cache
+            canvas.blit(font.render(line, True, 0xffff55), (rect.x + 5, rect.y + 3 + height * i))
+        rects = [rect] if self._rect is None else [rect, self._rect]
+        self._rect = rect
+        return rects
+
+    def hide(self) -> None:
+        self.overlay = False
+        self._rect = None
+
+
+PROFILER = Profiler()
+
+
+def profiled(name: str):
+    """Times every call of the decorated function as a section of the frame"""
+    def decorator(f):
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            if not PROFILER.active:
+                return f(*args, **kwargs)
+            with PROFILER.section(name):
+                return f(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+from collections.abc import Iterable
+
+import pygame
+
+from board import Board
+from util import grid
+
+try:
+    import numpy
+    from pygame import surfarray
+except ImportError:
+    numpy = None
+
+# ways of drawing every cell of a board at once, 'cells' draws them one at a time and always works, 'numpy' puts the
+# whole visible board together as arrays and blits it scaled up
+RASTERS = ('cells', 'numpy')
+
+
+def available(name: str) -> bool:
+    return name == 'cells' or name == 'numpy' and numpy is not None
+
+
+def next_raster(name: str) -> str:
+    """The raster after `name` that can be used here, for switching between them"""
+    names = [i for i in RASTERS if available(i)]
+    return names[(names.index(name) + 1) % len(names)] if name in names else names[0]
+
+
+def board_arrays(board: Board) -> tuple[numpy.ndarray, numpy.ndarray]:
+    """Colors and flags of a board as (size, size) arrays indexed [y, x], views that see every later write"""
+    size = board.size
+    return (numpy.frombuffer(board.colors, f'u{board.colors.itemsize}').reshape(size, size),
+            numpy.frombuffer(board.flags, numpy.uint8).reshape(size, size))
+
+
+def _visible(layout: grid) -> tuple[range, range, tuple[slice, slice]]:
+    columns, rows = layout.visible_range()
+    return columns, rows, (slice(rows.start, rows.stop), slice(columns.start, columns.stop))
+
+
+def draw_cells(surface: pygame.Surface, colors: numpy.ndarray, mask: numpy.ndarray | None, layout: grid) -> None:
+    """Draws the visible cells where `mask` is set as squares of their color, in one scaled blit"""
+    columns, rows, part = _visible(layout)
+    if not columns or not rows:
+        return
+    # surfarray is indexed [x, y], masked out cells are left fully transparent black like layers.TRANSPARENT
+    block = (colors[part] if mask is None else numpy.where(mask[part], colors[part], 0)).T
+    picture = pygame.Surface(block.shape, pygame.SRCALPHA)
+    pixels = surfarray.pixels3d(picture)
+    pixels[..., 0] = block >> 16 & 0xff
+    pixels[..., 1] = block >> 8 & 0xff
+    pixels[..., 2] = block & 0xff
+    del pixels
+    surfarray.pixels_alpha(picture)[...] = 255 if mask is None else mask[part].T * 255
+    box = layout.box_size
+    surface.blit(pygame.transform.scale(picture, (len(columns) * box, len(rows) * box)),
+                 (layout.x + columns.start * box, layout.y + rows.start * box))
+
+
+def draw_outlines(surface: pygame.Surface, c: int, layout: grid) -> None:
+    """A one pixel outline around every visible cell, blitted as a single tiled alpha mask"""
+    columns, rows, _ = _visible(layout)
+    if not columns or not rows:
+        return
+    box = layout.box_size
+    edge = numpy.zeros((box, box), bool)
+    edge[[0, -1], :] = True
+    edge[:, [0, -1]] = True
+    mask = numpy.tile(edge, (len(columns), len(rows)))
+    picture = pygame.Surface(mask.shape, pygame.SRCALPHA)
+    surfarray.pixels3d(picture)[mask] = c >> 16 & 0xff, c >> 8 & 0xff, c & 0xff
+    surfarray.pixels_alpha(picture)[...] = mask * 255
+    surface.blit(picture, (layout.x + columns.start * box, layout.y + rows.start * box))
+
+
+def visible_cells(mask: numpy.ndarray, layout: grid) -> numpy.ndarray:
+    """Indices of the visible cells where `mask` is set"""
+    columns, rows, part = _visible(layout)
+    ys, xs = numpy.nonzero(mask[part])
+    return (ys + rows.start) * layout.size + xs + columns.start
+
+
+def draw_markers(surface: pygame.Surface, marks: Iterable[tuple[int, pygame.Surface]], layout: grid) -> None:
+    """Draws every (cell, text) centered on its cell, in one Surface.blits call"""
+    box = layout.box_size
+    size = layout.size
+    surface.blits([(text, (layout.x + box * (i % size) + box // 2 - text.get_width() / 2,
+                           layout.y + box * (i // size) + box // 2 - text.get_height() / 2)) for i, text in marks],
+                  False)
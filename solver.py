@@ -0,0 +1,437 @@
+from __future__ import annotations
+
+import enum
+from collections.abc import Callable
+from dataclasses import dataclass, field
+
+
+class status(enum.Enum):
+    NONE = 0
+    UNIQUE = 1
+    MULTIPLE = 2
+
+
+class Cancelled(Exception):
+    """Raised out of Solver.run once its `stop` callback returns True"""
+
+
+@dataclass(eq=False)
+class _Part:
+    """Empty cells and the colors that have to fill them, which no other color can reach"""
+    free: int
+    heads: int
+    active: int
+    # set once the part was filled, a part searched to the end without ever being filled can't be filled at all
+    solved: bool = False
+
+
+class _Unsolvable(Exception):
+    """Raised up to the search that split a board into parts when one of them can't be filled"""
+
+    def __init__(self, part: _Part):
+        super().__init__()
+        self.part = part
+
+
+@dataclass
+class Solver:
+    """Exact search over a level dict ({'name', 'size', 'nodes'}).
+
+    Cells are bits of a python int (index = y * size + x). Both endpoints of a color are grown as heads, the most
+    constrained head is always extended first and single-option heads are applied without branching.
+    Once the empty cells fall apart into parts no color can reach more than one of, every part is searched on its own
+    and the search gives up on all of them as soon as one can't be filled. Inside a part the smallest region is
+    worked on first.
+
+    The first pass only looks for pipes that never run alongside themselves, like the generator makes them, which
+    rules out most of the ways a pipe can wander through open space. Only if that pass finds fewer than `limit`
+    solutions is the search run again over every path, so results stay exact.
+    A `stop` callback is asked before every branch whether the search should be given up."""
+    size: int
+    nodes: list[tuple[tuple[int, int], int]]
+    stop: Callable[[], bool] | None = None
+
+    colors: list[int] = field(init=False, default_factory=list)
+    solutions: list[dict[int, list[tuple[int, int]]]] = field(init=False, default_factory=list)
+    limit: int = field(init=False, default=1)
+
+    _start: list[int] = field(init=False, default_factory=list)
+    _free: int = field(init=False, default=0)
+    _neighbours: list[int] = field(init=False, default_factory=list)
+    _not_first: int = field(init=False, default=0)
+    _not_last: int = field(init=False, default=0)
+    _full: int = field(init=False, default=0)
+    _trail: list[tuple[int, int, int]] = field(init=False, default_factory=list)
+    _valid: bool = field(init=False, default=True)
+    # pipes may not run alongside themselves, `fences` passed through the search then holds the cells next to the
+    # body of every pipe, which it can't move into
+    _plain: bool = field(init=False, default=False)
+    # parts still to be searched (True) and parts whose cells are all filled once this entry is reached (False)
+    _todo: list[tuple[_Part, bool]] = field(init=False, default_factory=list)
+
+    def __post_init__(self):
+        size = self.size
+        if size < 1:
+            raise ValueError(f'invalid board size {size}')
+        self._full = (1 << size * size) - 1
+
+        first = sum(1 << y * size for y in range(size))
+        self._not_first = self._full & ~first
+        self._not_last = self._full & ~(first << size - 1)
+
+        for i in range(size * size):
+            x, y = i % size, i // size
+            mask = 0
+            if x > 0:
+                mask |= 1 << i - 1
+            if x < size - 1:
+                mask |= 1 << i + 1
+            if y > 0:
+                mask |= 1 << i - size
+            if y < size - 1:
+                mask |= 1 << i + size
+            self._neighbours.append(mask)
+
+        ends: dict[int, list[int]] = {}
+        taken = 0
+        for (x, y), c in self.nodes:
+            if not (0 <= x < size and 0 <= y < size):
+                raise ValueError(f'node {(x, y)} is outside of a {size}x{size} board')
+            if taken >> y * size + x & 1:
+                raise ValueError(f'node {(x, y)} is used more than once')
+            taken |= 1 << y * size + x
+            ends.setdefault(c, []).append(y * size + x)
+
+        self._free = self._full & ~taken
+        for c, cells in ends.items():
+            if len(cells) != 2:
+                self._valid = False
+            self.colors.append(c)
+            self._start.extend(cells[:2])
+
+    @classmethod
+    def from_level(cls, level: dict) -> Solver:
+        return cls(level['size'], level['nodes'])
+
+    def _grow(self, mask: int) -> int:
+        return (mask | (mask << 1 & self._not_first) | (mask >> 1 & self._not_last) | mask << self.size
+                | mask >> self.size) & self._full
+
+    def _regions(self, free: int, heads: int, ends: list[int], active: int,
+                 fences: list[int]) -> list[tuple[int, int]] | None:
+        """Splits the empty cells into regions, each with a mask of the colors that could fill it.
+
+        A path only ever runs through a single region, so every region needs a color of its own that touches it
+        with both heads, and every other color has to be able to join its heads directly. Returns None if that
+        can't be done. A single region is returned with every active color, the search only gets here once every
+        head has a way to go."""
+        size, not_first, not_last = self.size, self._not_first, self._not_last
+        cells = []
+        remaining = free
+        while remaining:
+            region = remaining & -remaining
+            while True:
+                grown = (region | region << 1 & not_first | region >> 1 & not_last | region << size
+                         | region >> size) & free
+                if grown == region:
+                    break
+                region = grown
+            remaining &= ~region
+            cells.append(region)
+        if len(cells) < 2:
+            return [(free, active)]
+
+        neighbours = self._neighbours
+        owner = {}
+        colors = active
+        while colors:
+            bit = colors & -colors
+            colors ^= bit
+            c = bit.bit_length() - 1
+            owner[ends[2 * c]] = owner[ends[2 * c + 1]] = c
+
+        regions: list[tuple[int, int]] = []
+        reached = 0
+        for region in cells:
+            once = candidates = 0
+            near = self._grow(region) & heads
+            while near:
+                bit = near & -near
+                near ^= bit
+                i = bit.bit_length() - 1
+                c = owner[i]
+                if neighbours[i] & region & ~fences[c]:
+                    candidates |= once & 1 << c
+                    once |= 1 << c
+            if not candidates:
+                return None
+            regions.append((region, candidates))
+            reached |= candidates
+
+        colors = active & ~reached
+        while colors:
+            bit = colors & -colors
+            colors ^= bit
+            c = bit.bit_length() - 1
+            if not neighbours[ends[2 * c]] >> ends[2 * c + 1] & 1:
+                return None
+        if not self._matched([i for _, i in regions]):
+            return None
+        return regions
+
+    @staticmethod
+    def _matched(regions: list[int]) -> bool:
+        """Returns True if each region can be given a distinct color out of its candidates"""
+        owner: dict[int, int] = {}
+
+        def assign(r: int, seen: int) -> bool:
+            candidates = regions[r] & ~seen
+            while candidates:
+                bit = candidates & -candidates
+                candidates ^= bit
+                seen |= bit
+                if bit not in owner or assign(owner[bit], seen):
+                    owner[bit] = r
+                    return True
+            return False
+
+        return all(assign(r, 0) for r in sorted(range(len(regions)), key=lambda r: regions[r].bit_count()))
+
+    def _dead_end(self, free: int, heads: int, cells: int) -> bool:
+        """Returns True if one of the empty cells in `cells` has less than two ways in or out"""
+        passable = free | heads
+        cells &= free
+        while cells:
+            bit = cells & -cells
+            cells ^= bit
+            if (self._neighbours[bit.bit_length() - 1] & passable).bit_count() < 2:
+                return True
+        return False
+
+    def _record(self) -> None:
+        size = self.size
+        sides: list[list[int]] = [[self._start[i]] for i in range(len(self._start))]
+        for c, side, cell in self._trail:
+            if cell >= 0:
+                sides[2 * c + side].append(cell)
+
+        solution = {}
+        for c, value in enumerate(self.colors):
+            path = sides[2 * c] + sides[2 * c + 1][::-1]
+            solution[value] = [(i % size, i // size) for i in path]
+        self.solutions.append(solution)
+
+    def _pick(self, free: int, ends: list[int], active: int, fences: list[int],
+              near: int) -> tuple[int, tuple[int, int, int, int, int] | None]:
+        """Finds the head in `near` with the fewest ways to go on, counting a join with its other head.
+
+        Returns the count and (color, side, head, other head, cells it can move into), a count of 0 if a head is
+        stuck."""
+        neighbours = self._neighbours
+        plain = self._plain
+        best = None
+        best_count = 5
+        colors = active
+        while colors:
+            bit = colors & -colors
+            colors ^= bit
+            c = bit.bit_length() - 1
+            for side in (0, 1):
+                head, other = ends[2 * c + side], ends[2 * c + 1 - side]
+                if not near >> head & 1:
+                    continue
+                around = neighbours[head]
+                if around >> other & 1:
+                    # a plain pipe next to its other end has to be joined right away
+                    options = 0 if plain else around & free
+                    count = options.bit_count() + 1
+                else:
+                    options = around & free & ~fences[c]
+                    count = options.bit_count()
+                if not count:
+                    return 0, None
+                if count < best_count:
+                    best, best_count = (c, side, head, other, options), count
+            if best_count == 1:
+                break
+        return best_count, best
+
+    def _split(self, regions: list[tuple[int, int]], ends: list[int], active: int) -> list[_Part]:
+        """Groups regions that share a candidate color into parts, smallest first"""
+        groups: list[tuple[int, int]] = []
+        for region, candidates in regions:
+            for j in range(len(groups) - 1, -1, -1):
+                if groups[j][1] & candidates:
+                    cells, colors = groups.pop(j)
+                    region |= cells
+                    candidates |= colors
+            groups.append((region, candidates))
+        groups.sort(key=lambda i: i[0].bit_count())
+
+        parts = []
+        # colors that can't reach any region have to join their heads directly, any part can do that
+        rest = active & ~sum(i for _, i in groups)
+        for cells, colors in groups:
+            colors |= rest
+            rest = 0
+            heads = 0
+            for c in range(len(self.colors)):
+                if colors >> c & 1:
+                    heads |= 1 << ends[2 * c] | 1 << ends[2 * c + 1]
+            parts.append(_Part(cells, heads, colors))
+        return parts
+
+    def _search_part(self, part: _Part, ends: list[int], fences: list[int]) -> bool:
+        """Searches a part on its own, raises _Unsolvable if it was never filled"""
+        self._todo.append((part, False))
+        try:
+            found = self._search(part.free, part.heads, ends[:], part.active, fences[:])
+        finally:
+            self._todo.pop()
+        if not found and not part.solved:
+            raise _Unsolvable(part)
+        return found
+
+    def _filled(self, ends: list[int], fences: list[int]) -> bool:
+        """Called once every cell being searched is filled, goes on with the next part or records a solution"""
+        if not self._todo:
+            self._record()
+            return len(self.solutions) >= self.limit
+        part, search = self._todo.pop()
+        try:
+            if search:
+                return self._search_part(part, ends, fences)
+            part.solved = True
+            return self._filled(ends, fences)
+        finally:
+            self._todo.append((part, search))
+
+    def _search(self, free: int, heads: int, ends: list[int], active: int, fences: list[int]) -> bool:
+        """Depth first search, returns True once enough solutions have been found"""
+        neighbours = self._neighbours
+        plain = self._plain
+        trail = self._trail
+        depth = len(trail)
+
+        try:
+            while True:
+                if not active:
+                    return not free and self._filled(ends, fences)
+
+                count, best = self._pick(free, ends, active, fences, self._full)
+                if not count:
+                    return False
+                c, side, head, other, options = best
+                if count > 1:
+                    break
+
+                # forced move, there is exactly one way to extend this head
+                if options:
+                    cell = options.bit_length() - 1
+                    ends[2 * c + side] = cell
+                    free &= ~options
+                    heads ^= 1 << head | options
+                    if plain:
+                        fences[c] |= neighbours[head]
+                    trail.append((c, side, cell))
+                    touched = neighbours[head] | neighbours[cell]
+                else:
+                    active &= ~(1 << c)
+                    heads &= ~(1 << head | 1 << other)
+                    trail.append((c, side, -1))
+                    touched = neighbours[head] | neighbours[other]
+                if self._dead_end(free, heads, touched):
+                    return False
+
+            if self.stop is not None and self.stop():
+                raise Cancelled
+            regions = self._regions(free, heads, ends, active, fences)
+            if regions is None:
+                return False
+            if len(regions) > 1:
+                parts = self._split(regions, ends, active)
+                if len(parts) > 1:
+                    mark = len(self._todo)
+                    self._todo.extend((i, True) for i in reversed(parts[1:]))
+                    try:
+                        return self._search_part(parts[0], ends, fences)
+                    except _Unsolvable as e:
+                        if e.part in parts:
+                            return False
+                        raise
+                    finally:
+                        del self._todo[mark:]
+
+                # branch on the most constrained head next to the smallest region, it is the quickest to run out
+                near = self._grow(min(regions, key=lambda i: i[0].bit_count())[0])
+                c, side, head, other, options = self._pick(free, ends, active, fences, near)[1]
+
+            moves = []
+            if neighbours[head] >> other & 1:
+                moves.append(-1)
+            while options:
+                bit = options & -options
+                options ^= bit
+                moves.append(bit.bit_length() - 1)
+            # cells with fewer free neighbours are tried first, paths tend to hug walls and other pipes
+            moves.sort(key=lambda i: -1 if i < 0 else (neighbours[i] & free).bit_count())
+
+            mark = len(trail)
+            for cell in moves:
+                branch = ends[:]
+                branch_fences = fences[:] if plain else fences
+                trail.append((c, side, cell))
+                if cell < 0:
+                    new_active = active & ~(1 << c)
+                    new_heads = heads & ~(1 << head | 1 << other)
+                    new_free = free
+                    touched = neighbours[head] | neighbours[other]
+                else:
+                    branch[2 * c + side] = cell
+                    if plain:
+                        branch_fences[c] |= neighbours[head]
+                    new_active = active
+                    new_heads = heads ^ (1 << head | 1 << cell)
+                    new_free = free & ~(1 << cell)
+                    touched = neighbours[head] | neighbours[cell]
+                if not self._dead_end(new_free, new_heads, touched) and \
+                        self._search(new_free, new_heads, branch, new_active, branch_fences):
+                    return True
+                del trail[mark:]
+            return False
+        finally:
+            del trail[depth:]
+
+    def run(self, limit: int = 1) -> list[dict[int, list[tuple[int, int]]]]:
+        """Searches for up to `limit` solutions, each maps a color to its path from one endpoint to the other.
+
+        Raises Cancelled if `stop` ended the search."""
+        self.solutions = []
+        self.limit = limit
+        self._trail = []
+        self._todo = []
+        if not self._valid:
+            return self.solutions
+
+        heads = 0
+        for i in self._start:
+            heads |= 1 << i
+        if self._dead_end(self._free, heads, self._full):
+            return self.solutions
+        for plain in (True, False):
+            self._plain = plain
+            self.solutions = []
+            self._search(self._free, heads, self._start[:], (1 << len(self.colors)) - 1, [0] * len(self.colors))
+            if len(self.solutions) >= limit:
+                break
+        return self.solutions
+
+
+def solve(level: dict) -> dict[int, list[tuple[int, int]]] | None:
+    """Returns a path for every color of the level, or None if the level can't be solved"""
+    solutions = Solver.from_level(level).run(1)
+    return solutions[0] if solutions else None
+
+
+def check_unique(level: dict) -> status:
+    return (status.NONE, status.UNIQUE, status.MULTIPLE)[len(Solver.from_level(level).run(2))]
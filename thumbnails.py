@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from collections.abc import Mapping
+
+import pygame
+from pygame import draw
+
+from data.codec import LevelFormatError
+from data.scores import default_directory, level_key
+
+THUMB = 96
+
+
+def render_thumbnail(level: dict, px: int = THUMB) -> pygame.Surface:
+    """Small picture of the nodes of a level"""
+    surface = pygame.Surface((px, px))
+    surface.fill(0x303030)
+    size = level['size']
+    for (x, y), c in level['nodes']:
+        left, top = x * px // size, y * px // size
+        rect = pygame.Rect(left, top, (x + 1) * px // size - left, (y + 1) * px // size - top)
+        draw.rect(surface, c, rect.inflate(-2, -2) if rect.w > 6 else rect)
+    return surface
+
+
+class ThumbnailCache:
+    """Thumbnails of the levels in a LEVELS like mapping, rendered by a background thread.
+
+    `request` replaces the levels the thread should work on, so levels that scrolled out of view are never rendered.
+    Finished thumbnails are kept in a LRU by level content hash and saved to disk, and their level ids are handed out
+    by `take_ready` so only those tiles need to be redrawn."""
+
+    def __init__(self, levels: Mapping[int, dict], directory: str | None = None, limit: int = 1024, px: int = THUMB):
+        self.levels = levels
+        self.directory = directory or os.path.join(default_directory(), 'thumbnails')
+        self.limit = limit
+        self.px = px
+
+        self.keys: dict[int, tuple[str, str]] = {}
+        self.surfaces: OrderedDict[str, pygame.Surface] = OrderedDict()
+        self._failed: set[int] = set()
+        self._wanted: list[int] = []
+        self._ready: list[int] = []
+        self._condition = threading.Condition()
+        self._thread: threading.Thread | None = None
+        self._closed = False
+
+    def get(self, level: int) -> pygame.Surface | None:
+        with self._condition:
+            key = self.keys.get(level)
+            if key is None or key[0] not in self.surfaces:
+                return None
+            self.surfaces.move_to_end(key[0])
+            return self.surfaces[key[0]]
+
+    def info(self, level: int) -> tuple[str, str] | None:
+        """Content hash and name of a level whose thumbnail was loaded"""
+        return self.keys.get(level)
+
+    def request(self, levels: list[int]) -> None:
+        """Makes these levels the ones to render next, in order"""
+        with self._condition:
+            self._wanted = [i for i in levels if i not in self._failed and
+                            (i not in self.keys or self.keys[i][0] not in self.surfaces)]
+            if self._wanted:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='thumbnails', daemon=True)
+                    self._thread.start()
+                self._condition.notify()
+
+    def take_ready(self) -> list[int]:
+        with self._condition:
+            ready = self._ready
+            self._ready = []
+            return ready
+
+    def close(self) -> None:
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f'{key}-{self.px}.thumb')
+
+    def _load(self, key: str) -> pygame.Surface | None:
+        try:
+            with open(self._path(key), 'rb') as f:
+                data = zlib.decompress(f.read())
+        except (OSError, zlib.error):
+            return None
+        if len(data) != self.px * self.px * 3:
+            return None
+        return pygame.image.frombytes(data, (self.px, self.px), 'RGB')
+
+    def _save(self, key: str, surface: pygame.Surface) -> None:
+        path = self._path(key)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(path + '.tmp', 'wb') as f:
+                f.write(zlib.compress(pygame.image.tobytes(surface, 'RGB')))
+            os.replace(path + '.tmp', path)
+        except OSError:
+            pass
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._wanted and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    return
+                i = self._wanted.pop(0)
+
+            try:
+                level = self.levels[i]
+                key = level_key(level)
+            except (KeyError, LevelFormatError):
+                with self._condition:
+                    self._failed.add(i)
+                continue
+            with self._condition:
+                cached = key in self.surfaces
+            surface = None
+            if not cached:
+                surface = self._load(key)
+                if surface is None:
+                    surface = render_thumbnail(level, self.px)
+                    self._save(key, surface)
+
+            with self._condition:
+                self.keys[i] = (key, level.get('name', ''))
+                if surface is not None:
+                    self.surfaces[key] = surface
+                    self.surfaces.move_to_end(key)
+                    while len(self.surfaces) > self.limit:
+                        self.surfaces.popitem(last=False)
+                self._ready.append(i)
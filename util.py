@@ -1,26 +1,165 @@
-import ast
-import base64
+from __future__ import annotations
+
 import math
+from collections import OrderedDict
 from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Iterator
 
 import pygame
 
+from data.codec import dumps, loads, loads_board
+
+if TYPE_CHECKING:
+    from board import Board
+
 
 NEARBY_TILES = [(0, 1), (0, -1), (1, 0), (-1, 0)]
 
+# tile flags, stored per cell in Board.flags
+FILLED = 1
+STRICT = 2
+CONNECTED = 4
+# direction from a pipe cell to the one before it, see pipes.link
+LINK = 0x38
+
 
-@dataclass
 class tile:
+    """View of a single cell of a Board, reads and writes go straight to the board arrays"""
+    __slots__ = ('board', 'index')
+
+    def __init__(self, board: Board, index: int):
+        self.board = board
+        self.index = index
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, tile) and self.board is other.board and self.index == other.index
+
+    def __hash__(self) -> int:
+        return hash((id(self.board), self.index))
+
+    def __repr__(self) -> str:
+        return f'tile(x={self.x}, y={self.y}, color={self.color:#08x}, filled={self.filled}, strict={self.strict})'
+
+    def _flag(self, flag: int, value: bool) -> None:
+        flags = self.board.flags[self.index]
+        self.board.set(self.index, self.board.colors[self.index], flags | flag if value else flags & ~flag)
+
+    @property
+    def x(self) -> int:
+        return self.index % self.board.size
+
+    @property
+    def y(self) -> int:
+        return self.index // self.board.size
+
+    @property
+    def color(self) -> int:
+        return self.board.colors[self.index]
+
+    @color.setter
+    def color(self, value: int) -> None:
+        self.board.set(self.index, value, self.board.flags[self.index])
+
+    @property
+    def filled(self) -> bool:
+        return bool(self.board.flags[self.index] & FILLED)
+
+    @filled.setter
+    def filled(self, value: bool) -> None:
+        self._flag(FILLED, value)
+
+    @property
+    def strict(self) -> bool:
+        return bool(self.board.flags[self.index] & STRICT)
+
+    @strict.setter
+    def strict(self, value: bool) -> None:
+        self._flag(STRICT, value)
+
+    @property
+    def connected(self) -> bool:
+        return bool(self.board.flags[self.index] & CONNECTED)
+
+    @connected.setter
+    def connected(self, value: bool) -> None:
+        self._flag(CONNECTED, value)
+
+
+
+@dataclass
+class grid:
+    """Screen layout of a board, maps pixels to cell indices and back with plain arithmetic.
 
+    With a `view` only the cells inside of it are hit and listed by `visible`."""
     x: int
     y: int
+    box_size: int
+    size: int
+    view: pygame.Rect | None = None
 
-    color: int = 0x202020
-    filled: bool = True
-    strict: bool = True
+    @property
+    def rect(self) -> pygame.Rect:
+        return pygame.Rect(self.x, self.y, self.size * self.box_size, self.size * self.box_size)
 
-    connected: bool = field(init=False, default=False)
-    hit_box: pygame.Rect = field(init=False)
+    def cell_at(self, pos: tuple[int, int]) -> int | None:
+        if self.box_size <= 0 or self.view is not None and not self.view.collidepoint(pos):
+            return None
+        x = (pos[0] - self.x) // self.box_size
+        y = (pos[1] - self.y) // self.box_size
+        if 0 <= x < self.size and 0 <= y < self.size:
+            return y * self.size + x
+        return None
+
+    def cell_rect(self, i: int) -> pygame.Rect:
+        return pygame.Rect(self.x + self.box_size * (i % self.size), self.y + self.box_size * (i // self.size),
+                           self.box_size, self.box_size)
+
+    def visible_rect(self, i: int) -> pygame.Rect:
+        """The part of a cell inside the view, for Surface.fill which paints past the clip area for rects that start
+        above or left of the surface"""
+        rect = self.cell_rect(i)
+        return rect.clip(self.view) if self.view is not None else rect
+
+    def visible_range(self) -> tuple[range, range]:
+        """Columns and rows of the cells that are at least partly inside the view"""
+        if self.view is None or self.box_size <= 0:
+            return range(self.size), range(self.size)
+        box = self.box_size
+        columns = range(max(0, (self.view.left - self.x) // box), min(self.size, (self.view.right - 1 - self.x) // box + 1))
+        rows = range(max(0, (self.view.top - self.y) // box), min(self.size, (self.view.bottom - 1 - self.y) // box + 1))
+        return columns, rows
+
+    def visible(self) -> Iterator[int]:
+        columns, rows = self.visible_range()
+        for y in rows:
+            for x in columns:
+                yield y * self.size + x
+
+    def nearest_cell(self, pos: tuple[int, int]) -> int | None:
+        """The cell at `pos` or the one on the edge of the visible board closest to it"""
+        area = self.rect if self.view is None else self.rect.clip(self.view)
+        if not area.w or not area.h:
+            return None
+        return self.cell_at((max(area.left, min(pos[0], area.right - 1)), max(area.top, min(pos[1], area.bottom - 1))))
+
+    def line(self, start: int, end: int) -> list[int]:
+        """Cells crossed going straight from `start` to `end`, each one next to the one before, without `start`"""
+        x, y = start % self.size, start // self.size
+        dx, dy = end % self.size - x, end // self.size - y
+        sx, sy = (1 if dx > 0 else -1), (1 if dy > 0 else -1)
+        dx, dy = abs(dx), abs(dy)
+        cells = []
+        moved_x = moved_y = 0
+        for _ in range(dx + dy):
+            # step along whichever axis the middle of the next cell on it is closer on the line
+            if (2 * moved_x + 1) * dy < (2 * moved_y + 1) * dx:
+                x += sx
+                moved_x += 1
+            else:
+                y += sy
+                moved_y += 1
+            cells.append(y * self.size + x)
+        return cells
 
 
 @dataclass
@@ -39,8 +178,46 @@ class color:
     gray = 0x202020
 
 
-def clear_canvas(canvas: pygame.Surface):
-    canvas.fill(0x202020)
+@dataclass
+class text_cache:
+    """Rendered text surfaces, least recently used ones are dropped once `limit` is reached"""
+    limit: int = 512
+
+    hits: int = field(init=False, default=0)
+    misses: int = field(init=False, default=0)
+    surfaces: OrderedDict[tuple, pygame.Surface] = field(init=False, default_factory=OrderedDict)
+
+    def render(self, font: pygame.font.Font, text: str, text_color: int, antialias: bool = True) -> pygame.Surface:
+        # a font object is a single face at a single size, so it stands in for both in the key
+        key = (font, text, text_color, antialias)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.hits += 1
+            self.surfaces.move_to_end(key)
+            return surface
+
+        self.misses += 1
+        surface = self.surfaces[key] = font.render(text, antialias, text_color)
+        if len(self.surfaces) > self.limit:
+            self.surfaces.popitem(last=False)
+        return surface
+
+    def clear(self) -> None:
+        self.surfaces.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+TEXT_CACHE = text_cache()
+
+
+def render_text(font: pygame.font.Font, text: str, text_color: int, antialias: bool = True) -> pygame.Surface:
+    """Renders text through the shared cache, the returned surface must not be drawn on"""
+    return TEXT_CACHE.render(font, text, text_color, antialias)
+
+
+def clear_canvas(canvas: pygame.Surface, rect: pygame.Rect | None = None):
+    canvas.fill(0x202020, rect)
 
 
 def draw_centered_text(canvas: pygame.Surface, text: pygame.Surface, x: float, y: float) -> None:
@@ -53,39 +230,64 @@ def draw_right_align_text(canvas: pygame.Surface, text: pygame.Surface, x: float
     canvas.blit(text, (x - text_rect.width, y))
 
 
-def get_nearby(board: dict[tuple[int, int], tile], x: int, y: int) -> list[tile]:
-    return [board[(x + i, y + j)] for i, j in NEARBY_TILES if (x + i, y + j) in board]
+def coalesce_motion(events: list[pygame.event.Event]) -> list[pygame.event.Event]:
+    """Merges every run of mouse motion events into one, so a fast mouse costs one pass through the handlers a frame.
+
+    The merged event ends where the last one did, with the movement added up and every position on the way in `path`."""
+    merged = []
+    run: list[pygame.event.Event] = []
+    for event in events + [None]:
+        if event is not None and event.type == pygame.MOUSEMOTION:
+            run.append(event)
+            continue
+        if len(run) == 1:
+            merged.append(run[0])
+        elif run:
+            last = run[-1]
+            merged.append(pygame.event.Event(pygame.MOUSEMOTION, pos=last.pos, buttons=last.buttons,
+                                             rel=(sum(i.rel[0] for i in run), sum(i.rel[1] for i in run)),
+                                             path=[i.pos for i in run]))
+        run = []
+        if event is not None:
+            merged.append(event)
+    return merged
 
 
-def check_filled(board: dict[tuple[int, int], tile]) -> bool:
-    return all([board[i].filled for i in board])
+def get_nearby(board: Board, x: int, y: int) -> list[tile]:
+    return [tile(board, i) for i in board.neighbours[board.index(x, y)]]
 
 
-def find_color(board: dict[tuple[int, int], tile], c: int) -> list[tile]:
-    return [board[i] for i in board if board[i].color == c]
+def check_filled(board: Board) -> bool:
+    return board.is_filled()
 
 
-def clear_color(board: dict[tuple[int, int], tile], c: int) -> None:
-    for tile_c in find_color(board, c):
-        if tile_c.strict:
-            tile_c.connected = False
-            continue
-        tile_c.color = color.gray
-        tile_c.filled = False
+def find_color(board: Board, c: int) -> list[tile]:
+    return [tile(board, i) for i in board.find_color(c)]
+
 
+def clear_color(board: Board, c: int) -> None:
+    board.clear_color(c)
 
-def check_number_connected(board: dict[tuple[int, int], tile]) -> int:
-    return len([board[i] for i in board if board[i].connected]) // 2
 
+def check_number_connected(board: Board) -> int:
+    return board.count_connected() // 2
 
-def encode_data(board: dict[tuple[int, int], tile], name: str, size: int) -> bytes:
+
+def encode_data(board: Board, name: str, size: int) -> bytes:
+    """Encodes the board as shareable level text, raises data.codec.LevelFormatError if it isn't a valid level"""
     data = {
         'name': name,
         'size': size,
-        'nodes': [((board[i].x, board[i].y), board[i].color) for i in board if board[i].strict and board[i].filled]
+        'nodes': board.nodes()
     }
-    return base64.b64encode(str(data).encode('utf-8'))
+    return dumps(data).encode('ascii')
+
+
+def unload_data(data: str | bytes) -> dict:
+    """Decodes level text from encode_data or the older base64(str(dict)) format, raises LevelFormatError"""
+    return loads(data)
 
 
-def unload_data(data: str) -> dict:
-    return ast.literal_eval(base64.b64decode(data).decode())
+def unload_board(data: str | bytes) -> tuple[str, Board]:
+    """Like unload_data, but decodes straight into a Board, returns the level name and the board"""
+    return loads_board(data)
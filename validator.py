@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import enum
+import multiprocessing
+import queue
+from collections import Counter
+from dataclasses import dataclass, field
+
+from solver import Cancelled, Solver
+
+
+class verdict(enum.Enum):
+    CHECKING = 'checking...'
+    INCOMPLETE = 'incomplete pairs'
+    UNSOLVABLE = 'unsolvable'
+    UNIQUE = 'unique'
+    SOLVABLE = 'solvable'
+
+
+def _work(jobs: multiprocessing.Queue, results: multiprocessing.Queue, latest) -> None:
+    """Worker process, checks the newest level it was sent until it is told to stop with None"""
+    while True:
+        batch = [jobs.get()]
+        while True:
+            try:
+                batch.append(jobs.get_nowait())
+            except queue.Empty:
+                break
+        if None in batch:
+            return
+        # levels that were replaced while this one was being checked are never looked at
+        job, level = batch[-1]
+        if job != latest.value:
+            continue
+        try:
+            found = len(Solver(level['size'], level['nodes'], lambda: latest.value != job).run(2))
+        except Cancelled:
+            continue
+        results.put((job, (verdict.UNSOLVABLE, verdict.UNIQUE, verdict.SOLVABLE)[found]))
+
+
+@dataclass
+class Validator:
+    """Checks whether a level being edited can be solved and if only one way, in a worker process.
+
+    Every `submit` replaces the level being checked, the worker gives up on the old one at its next branch, so a long
+    search never holds up the check of a newer board. The process is only started by the first level that needs it."""
+    _process: multiprocessing.Process | None = field(init=False, default=None)
+    _jobs: multiprocessing.Queue = field(init=False, default=None)
+    _results: multiprocessing.Queue = field(init=False, default=None)
+    _latest: object = field(init=False, default=None)
+    _job: int = field(init=False, default=0)
+
+    def start(self) -> None:
+        # spawn rather than fork, the parent process owns an SDL window
+        context = multiprocessing.get_context('spawn')
+        self._jobs = context.Queue()
+        self._results = context.Queue()
+        self._latest = context.RawValue('q', self._job)
+        self._process = context.Process(target=_work, args=(self._jobs, self._results, self._latest),
+                                        name='validator', daemon=True)
+        self._process.start()
+
+    def shutdown(self) -> None:
+        if self._process is not None:
+            self._latest.value = -1
+            self._jobs.put(None)
+            self._process.join(1)
+            if self._process.is_alive():
+                self._process.terminate()
+            self._process = None
+
+    def submit(self, size: int, nodes: list[tuple[tuple[int, int], int]]) -> verdict:
+        """Starts checking a level, returns CHECKING or what is already known without a search"""
+        self._job += 1
+        if self._latest is not None:
+            self._latest.value = self._job
+        pairs = Counter(c for _, c in nodes)
+        if not pairs or any(i != 2 for i in pairs.values()):
+            return verdict.INCOMPLETE
+        if self._process is None:
+            self.start()
+        self._jobs.put((self._job, {'size': size, 'nodes': nodes}))
+        return verdict.CHECKING
+
+    def poll(self) -> verdict | None:
+        """Result for the level submitted last once the worker has one, results of older levels are thrown away"""
+        if self._process is None:
+            return None
+        found = None
+        while True:
+            try:
+                job, result = self._results.get_nowait()
+            except queue.Empty:
+                return found
+            if job == self._job:
+                found = result